@@ -0,0 +1,195 @@
+import sys
+import io
+import json
+import tempfile
+import contextlib
+from pathlib import Path
+import vmTranslator
+import hackEmulator
+import compiler
+
+#Directory holding one sub directory of .vm files per benchmark program,
+#or of .jack files to be compiled first
+BENCHMARKS = Path(__file__).parent / 'benchmarks'
+
+#Longest run allowed to any one program, so a broken translation cannot hang
+MAX_CYCLES = 50000000
+
+def measure(name, options):
+    '''measure(str, dict) -> dict
+
+    Translates the benchmark program name with the translator options
+    given, runs it on the emulator until it halts and returns a
+    dictionary of its size in instructions, the instructions executed
+    and the value Sys.init returned. A program of .jack files is first
+    compiled to vm files, with the --jobs given; if that fails the
+    errors are printed and the result is None.
+    '''
+    vmFiles = sorted(str(f) for f in (BENCHMARKS / name).glob('*.vm'))
+    jackFiles = sorted(str(f) for f in (BENCHMARKS / name).glob('*.jack'))
+    with tempfile.TemporaryDirectory() as directory:
+        if jackFiles:
+            vmFiles = [str(Path(directory) / Path(jackFile).with_suffix('.vm').name)
+                       for jackFile in jackFiles]
+            errors = [message for message in compiler.compileFiles(
+                jackFiles, vmFiles, int(options.get('jobs', 1))) if message is not None]
+            for message in errors:
+                print('Error:', message)
+            if errors:
+                return {'size': 0, 'cycles': 0, 'result': None}
+        asmFname = str(Path(directory) / (name + '.asm'))
+        #The translator reports on stdout, which would garble the table
+        with contextlib.redirect_stdout(io.StringIO()):
+            vmTranslator.translateProgram(asmFname, vmFiles, options)
+        #--format=hack or bin writes machine code next to the .asm instead
+        code, symbols = hackEmulator.loadProgram(asmFname[:-4] + '.' + options.get('format', 'asm'))
+    emulator = hackEmulator.Emulator(code, symbols)
+    cycles = emulator.run(MAX_CYCLES)
+    #Sys.init returns into the bootstrap, leaving its value at the stack base
+    result = emulator.signed(256) if emulator.halted() else None
+    return {'size': len(code), 'cycles': cycles, 'result': result}
+
+def checkGolden(name):
+    '''checkGolden(str) -> list
+
+    Compiles every class of the benchmark program name that has a file
+    in its golden directory, such as golden/Main.xml, in the format of
+    that file's extension, and returns a message for each output that
+    differs from the golden file.
+    '''
+    mismatches = []
+    with tempfile.TemporaryDirectory() as directory:
+        for golden in sorted((BENCHMARKS / name / 'golden').glob('*')):
+            output = str(Path(directory) / golden.name)
+            jackFile = str(BENCHMARKS / name / (golden.stem + '.jack'))
+            message = compiler.compileFile(jackFile, output, golden.suffix[1:])
+            if message is None and Path(output).read_bytes() != golden.read_bytes():
+                message = 'output differs from golden/' + golden.name
+            if message is not None:
+                mismatches.append(message)
+    return mismatches
+
+def checkCache(name):
+    '''checkCache(str) -> list
+
+    Compiles the Jack files of the benchmark program name, in a copy of
+    its directory, with --cache in a sequence of runs that must each
+    reuse a known number of files, and returns a message for each run
+    that does not, or that leaves an output different from a fresh
+    compilation.
+    '''
+    jackFiles = sorted((BENCHMARKS / name).glob('*.jack'))
+    if not jackFiles:
+        return []
+    mismatches = []
+    with tempfile.TemporaryDirectory() as directory:
+        copies = []
+        for jackFile in jackFiles:
+            copy = Path(directory) / jackFile.name
+            copy.write_bytes(jackFile.read_bytes())
+            copies.append(str(copy))
+        first = Path(copies[0]).with_suffix('.vm')
+        #Each run: (description, options, change made before it, files reused)
+        runs = [('cold cache', {'cache': True}, None, 0),
+                ('warm cache', {'cache': True}, None, len(copies)),
+                ('edited output', {'cache': True}, lambda: first.write_bytes(b'return\n'), len(copies) - 1),
+                ('output rewritten without cache', {},
+                 lambda: Path(copies[0]).write_bytes(
+                     b'class ' + jackFiles[0].stem.encode() + b' { function int f() { return 0; } }'), 0),
+                ('source restored', {'cache': True},
+                 lambda: Path(copies[0]).write_bytes(jackFiles[0].read_bytes()), len(copies) - 1),
+                ('other format', {'cache': True, 'format': 'xml'}, None, 0),
+                ('format switched back', {'cache': True}, None, len(copies))]
+        for description, options, change, reused in runs:
+            if change is not None:
+                change()
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                messages = compiler.compileProgram(copies, options)
+            expected = 'Cache: reused {} of {} files'.format(reused, len(copies))
+            if messages:
+                mismatches.append(description + ': ' + '; '.join(messages))
+            elif 'cache' in options and expected not in output.getvalue():
+                mismatches.append(description + ': ' + expected + ' expected')
+        fresh = Path(directory) / 'fresh.vm'
+        message = compiler.compileFile(str(jackFiles[0]), str(fresh))
+        if message is None and fresh.read_bytes() != first.read_bytes():
+            message = 'cached output differs from a fresh compilation'
+        if message is not None:
+            mismatches.append(message)
+    return mismatches
+
+def compare(results, baseline):
+    '''compare(dict, dict) -> list
+
+    Returns a list of messages, one for each program whose size or
+    instruction count grew over the baseline.
+    '''
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for quantity in ('size', 'cycles'):
+            if result[quantity] > baseline[name][quantity]:
+                regressions.append('{}: {} grew from {} to {}'.format(
+                    name, quantity, baseline[name][quantity], result[quantity]))
+    return regressions
+
+def printUsage():
+    '''printUsage() -> None
+
+    Prints information on how to call this file.
+    '''
+    print("Usage: benchmark [options] [program ...]")
+    print("Translates and runs the programs in benchmarks/ (default: all of them),")
+    print("compiling those written in Jack first and checking their golden/ outputs")
+    print("options are")
+    print("\t--baseline=FILE\tfail if any program is larger or slower than in FILE")
+    print("\t--save=FILE\twrite the results to FILE, for use as a baseline")
+    print("\tany other option is passed on to the translator, e.g. --optimize")
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = vmTranslator.getOptions()
+    baselineFname = options.pop('baseline', None)
+    saveFname = options.pop('save', None)
+    if 'help' in options:
+        printUsage()
+        sys.exit()
+    with open(BENCHMARKS / 'expected.json') as expectedFile:
+        expected = json.load(expectedFile)
+    names = args if args else sorted(expected)
+    failed = False
+    results = {}
+    print('{:<12}{:>8}{:>12}  {}'.format('program', 'size', 'cycles', 'result'))
+    for name in names:
+        if name not in expected:
+            printUsage()
+            print('Unknown program:', name, '\nAborting!')
+            sys.exit(1)
+        result = measure(name, options)
+        results[name] = result
+        status = 'ok'
+        if result['result'] != expected[name]:
+            status = 'WRONG (expected {})'.format(expected[name])
+            failed = True
+        mismatches = checkGolden(name) + checkCache(name)
+        if mismatches:
+            status = 'WRONG (' + '; '.join(mismatches) + ')'
+            failed = True
+        print('{:<12}{:>8}{:>12}  {} {}'.format(name, result['size'], result['cycles'],
+                                               result['result'], status))
+    if saveFname:
+        with open(saveFname, 'w') as saveFile:
+            json.dump(results, saveFile, indent=2, sort_keys=True)
+    if baselineFname:
+        with open(baselineFname) as baselineFile:
+            regressions = compare(results, json.load(baselineFile))
+        for message in regressions:
+            print('Regression:', message)
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
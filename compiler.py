@@ -1,503 +1,1271 @@
 import sys
+import os
 import re
+import json
+import hashlib
+from array import array
 from pathlib import Path
- 
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
 class JackTokenizer(object):
-    '''Removes all comments and white space from the input stream and
-    breaks it into Jack-language tokens, as specified by the Jack
-    grammar.'''
-     
-    def __init__(self,inputFile):
-        '''Constructor - Opens inputFile and gets ready to tokenize it.'''
-        self.file = open(inputFile, 'r')
-        self.read = self.file.read()
-        #The folowing RegEx removes comments of both types: // and /*
-        self.read = re.sub('\//+(.*?)\n|\/\*[\s\S]+?\*\/','', self.read)
-        #The following RegEx splits the jack input file into tokens
-        regex = "\s*(\d+|\w+|.)"
-        self.tokens = re.findall(regex, self.read)
-        #Reversing as list.pop() is a FIFO operation
-        self.tokens.reverse()
-        #Pop the first token into the currentToken
-        self.currentToken = self.tokens.pop()
- 
-    def hasMoreTokens(self):
-        '''JT.hasMoreTokens() -> bool
- 
-        Returns True if there are more tokens left, False otherwise.'''
-        #If list becomes empty, there are no more tokens left to parse
-        if len(self.tokens) == 0:
-            return False
-        else:
-            return True
-         
-    def nextToken(self):
-        return self.tokens[-1]
-     
-    def advance(self):
-        '''JT.advance() -> None
- 
-        Gets the next token from the input and makes it the current
-        token. Should only be called if hasmoreTokens() is
-        True. Initially there is no current token
-        '''
-        #pop() tokens into the currentToken variable
-        if self.hasMoreTokens() == True:
-            self.currentToken = self.tokens.pop()
-         
-     
-    def tokenType(self):
-        '''JT.tokenType() -> str
- 
-        Returns the type of the current token which is one of:
-        KEYWORD
-        SYMBOL
-        IDENTIFIER
-        INT_CONST
-        STRING_CONST
-        '''
-        symbol = ['{','}','(',')','[',']','.',',',';','+','-','*','/','&','|','<','>','=','~']
-        keyword=['class','constructor','function','method','field','static','var','int','char','boolean','void','true','false','null','this','let','do','if','else','while','return']
-        if self.currentToken in keyword:
-            return "KEYWORD"
-        elif self.currentToken in symbol:
-            return "SYMBOL"
-        elif self.currentToken.isnumeric():
-            return "INT_CONST"
-        elif self.currentToken== '"':
-            return "STRING_CONST"
-        else:
-            return "IDENTIFIER"
-         
-    def keyWord(self):
-        '''JT.keyWord() -> str
- 
-        Returns the keyword which is the current token. Should be
-        called only when tokentype() is KEYWORD. Return value is one of:
-        CLASS, METHOD, FUNCTION, CONSTRUCTOR, INT,
-        BOOLEAN, CHAR, VOID, VAR, STATIC, 'FIELD, LET,
-        DO, IF, ELSE, WHILE, RETURN, TRUE, FALSE,
-        NULL, THIS
-        '''
-        if self.tokenType() == "KEYWORD":
-            return self.currentToken
-     
-    def symbol(self):
-        '''JT.symbol() -> str
- 
-        Returns the character which is the current token. Should be
-        called only when tokentype() is SYMBOL.
-        '''
-        if self.tokenType() == "SYMBOL":
-            return self.currentToken
-     
-     
-    def identifier(self):
-        '''JT.identifier() -> str
- 
-        Returns the identifier which is the current token. Should be
-        called only when tokenType() is IDENTIFIER.
-        '''
-        if self.tokenType() == "IDENTIFIER":
-            return self.currentToken
-     
-    def intVal(self):
-        '''JT.intVal() -> int
- 
-        Returns the integer value of the current token. Should be
-        called only when tokenType() is INT_CONST.
-        '''
-        if self.tokenType() == "INT_CONST":
-            numeric = int(self.currentToken)
-            if numeric >= 0 and numeric <= 32767:
-                return numeric
-            else:
-                print("CONSTANT OUT OF RANGE")
-     
-    def stringVal(self):
-        '''JT.stringVal() -> str
- 
-        Returns the string value of the current token, without double
-        quotes. Should be called only when TokenType() is
-        STRING_CONST.
-        '''
-        if self.tokenType() == "STRING_CONST":
-            #Combines all tokens between double quotes
-            self.currentToken = self.currentToken + " " + self.tokens.pop()
-            while self.currentToken[-1] != "\"":
-                self.currentToken = self.currentToken + " " + self.tokens.pop()
-            return self.currentToken
-                 
-         
-     
+    '''Removes all comments and white space from the input stream and
+    breaks it into Jack-language tokens, as specified by the Jack
+    grammar. The whole file is split in one pass of the TOKEN regex,
+    which also classifies every token as it is found. Tokens are kept
+    as their type code and the offsets of their text in the bytes of
+    the file, in arrays, and their text is only sliced out when asked
+    for, so any token can be looked at by its index.'''
+
+    KEYWORDS = frozenset(['class', 'constructor', 'function', 'method', 'field', 'static',
+                          'var', 'int', 'char', 'boolean', 'void', 'true', 'false', 'null',
+                          'this', 'let', 'do', 'if', 'else', 'while', 'return'])
+
+    #Token types, indexed by their code in self.types
+    TYPES = ['KEYWORD', 'SYMBOL', 'IDENTIFIER', 'INT_CONST', 'STRING_CONST']
+
+    #One alternative per kind of token, tried in order. Comments and
+    #white space are skipped, and anything else is an error. Keywords
+    #are matched before identifiers, as whole words.
+    TOKEN = re.compile(rb'''
+        (?P<skip>(?:\s+|//[^\n]*|/\*.*?\*/)+)
+        |(?P<KEYWORD>(?:''' + '|'.join(sorted(KEYWORDS)).encode() + rb''')(?!\w))
+        |(?P<IDENTIFIER>[A-Za-z_]\w*)
+        |(?P<INT_CONST>\d+)
+        |"(?P<STRING_CONST>[^"\n]*)"
+        |(?P<unterminated>/\*|")
+        |(?P<SYMBOL>[{}()\[\].,;+\-*/&|<>=~])
+        |(?P<invalid>.)
+        ''', re.VERBOSE | re.DOTALL)
+
+    def __init__(self,inputFile):
+        '''Constructor - Opens inputFile and gets ready to tokenize it.'''
+        self.data = Path(inputFile).read_bytes()
+        self.name = inputFile
+        self.types = array('B')
+        #Offsets of the text of every token in self.data
+        self.starts = array('I')
+        self.ends = array('I')
+        self._tokenize()
+        self.position = 0
+        self.currentToken = self.text(0)
+
+    def __str__(self):
+        return 'JackTokenizer object.'
+
+    def _tokenize(self):
+        '''JT._tokenize() -> None
+
+        Fills the arrays with the type and offsets of every token in the
+        input, string constants without their double quotes. Raises
+        ValueError on anything that is not a token.
+        '''
+        codes = {name: code for code, name in enumerate(self.TYPES)}
+        #Gathered in lists and added to the arrays at once, which is
+        #faster than adding the tokens one by one
+        types = []
+        starts = []
+        ends = []
+        for match in self.TOKEN.finditer(self.data):
+            kind = match.lastgroup
+            if kind == 'skip':
+                continue
+            if kind == 'unterminated' or kind == 'invalid':
+                line, column = self._location(match.start())
+                value = match.group().decode(errors='replace')
+                if kind == 'invalid':
+                    message = 'invalid character {!r}'.format(value)
+                else:
+                    message = 'unterminated ' + ('string' if value == '"' else 'comment')
+                raise ValueError('{}:{}:{}: {}'.format(self.name, line, column, message))
+            start, end = match.span(kind)
+            types.append(codes[kind])
+            starts.append(start)
+            ends.append(end)
+        self.types.extend(types)
+        self.starts.extend(starts)
+        self.ends.extend(ends)
+        self.count = len(types)
+
+    def _location(self, offset):
+        '''JT._location(int) -> tuple
+
+        Returns the line and column of the byte at offset in the input.
+        '''
+        line = self.data.count(b'\n', 0, offset) + 1
+        column = offset - self.data.rfind(b'\n', 0, offset)
+        return (line, column)
+
+    def __len__(self):
+        return self.count
+
+    def text(self, index):
+        '''JT.text(int) -> str
+
+        Returns the text of the token at index, or None past the end.
+        '''
+        if index >= self.count:
+            return None
+        return self.data[self.starts[index]:self.ends[index]].decode()
+
+    def typeAt(self, index):
+        '''JT.typeAt(int) -> str
+
+        Returns the type of the token at index, as tokenType() does, or
+        None past the end.
+        '''
+        if index >= self.count:
+            return None
+        return self.TYPES[self.types[index]]
+
+    def lookAhead(self, distance=1):
+        '''JT.lookAhead(int) -> str
+
+        Returns the text of the token distance tokens after the current
+        one, without advancing, or None past the end.
+        '''
+        return self.text(self.position + distance)
+
+    def hasMoreTokens(self):
+        '''JT.hasMoreTokens() -> bool
+
+        Returns True if there are more tokens left, False otherwise.'''
+        return self.position + 1 < self.count
+
+    def nextToken(self):
+        '''JT.nextToken() -> str
+
+        Returns the token after the current one, without advancing.
+        Raises ValueError if the current token is the last one.'''
+        if not self.hasMoreTokens():
+            raise ValueError('{}: unexpected end of file'.format(self.name))
+        return self.lookAhead(1)
+
+    def advance(self):
+        '''JT.advance() -> None
+
+        Gets the next token from the input and makes it the current
+        token. Should only be called if hasmoreTokens() is
+        True. Initially the current token is the first one.
+        '''
+        position = self.position + 1
+        if position < self.count:
+            self.position = position
+            self.currentToken = self.data[self.starts[position]:self.ends[position]].decode()
+
+    def tokenType(self):
+        '''JT.tokenType() -> str
+
+        Returns the type of the current token which is one of:
+        KEYWORD
+        SYMBOL
+        IDENTIFIER
+        INT_CONST
+        STRING_CONST
+        '''
+        return self.TYPES[self.types[self.position]]
+
+    def keyWord(self):
+        '''JT.keyWord() -> str
+
+        Returns the keyword which is the current token. Should be
+        called only when tokentype() is KEYWORD. Return value is one of:
+        class, method, function, constructor, int,
+        boolean, char, void, var, static, field, let,
+        do, if, else, while, return, true, false,
+        null, this
+        '''
+        if self.tokenType() == "KEYWORD":
+            return self.currentToken
+
+    def symbol(self):
+        '''JT.symbol() -> str
+
+        Returns the character which is the current token. Should be
+        called only when tokentype() is SYMBOL.
+        '''
+        if self.tokenType() == "SYMBOL":
+            return self.currentToken
+
+    def identifier(self):
+        '''JT.identifier() -> str
+
+        Returns the identifier which is the current token. Should be
+        called only when tokenType() is IDENTIFIER.
+        '''
+        if self.tokenType() == "IDENTIFIER":
+            return self.currentToken
+
+    def intVal(self):
+        '''JT.intVal() -> int
+
+        Returns the integer value of the current token. Should be
+        called only when tokenType() is INT_CONST.
+        '''
+        if self.tokenType() == "INT_CONST":
+            numeric = int(self.currentToken)
+            if numeric >= 0 and numeric <= 32767:
+                return numeric
+            else:
+                print("CONSTANT OUT OF RANGE")
+
+    def stringVal(self):
+        '''JT.stringVal() -> str
+
+        Returns the string value of the current token, without double
+        quotes. Should be called only when TokenType() is
+        STRING_CONST.
+        '''
+        if self.tokenType() == "STRING_CONST":
+            return self.currentToken
+
+    def location(self):
+        '''JT.location() -> tuple
+
+        Returns the line and column where the current token starts, at
+        the opening double quote of a string constant.
+        '''
+        start = self.starts[self.position]
+        if self.tokenType() == 'STRING_CONST':
+            start = start - 1
+        return self._location(start)
+
+class SymbolTable(object):
+    '''Gives the kind, type and index of every variable in scope: the
+    static and field variables of the class, and the arguments and
+    local variables of the subroutine being compiled, which hide those
+    of the class. Each scope is a dictionary from names to (kind, type,
+    index) tuples, so every lookup takes one or two dictionary reads.
+    Kinds are STATIC, FIELD, ARG and VAR.
+    '''
+
+    #The VM segment of each kind of variable
+    SEGMENTS = {'STATIC': 'static', 'FIELD': 'this', 'ARG': 'argument', 'VAR': 'local'}
+
+    def __init__(self):
+        '''Constructor - Creates a new empty symbol table.'''
+        self.classScope = {}
+        self.subroutineScope = {}
+        self.counts = dict.fromkeys(self.SEGMENTS, 0)
+
+    def __str__(self):
+        return 'SymbolTable object.'
+
+    def startSubroutine(self):
+        '''ST.startSubroutine() -> None
+
+        Starts a new subroutine scope, forgetting the arguments and
+        local variables of the previous one.
+        '''
+        self.subroutineScope = {}
+        self.counts['ARG'] = 0
+        self.counts['VAR'] = 0
+
+    def define(self, name, type, kind):
+        '''ST.define(str, str, str) -> None
+
+        Defines a new variable of the given name, type and kind, with
+        the next index of its kind. STATIC and FIELD variables belong to
+        the class, ARG and VAR variables to the subroutine.
+        '''
+        scope = self.classScope if kind in ('STATIC', 'FIELD') else self.subroutineScope
+        scope[name] = (kind, type, self.counts[kind])
+        self.counts[kind] = self.counts[kind] + 1
+
+    def defined(self, name, kind):
+        '''ST.defined(str, str) -> bool
+
+        Returns True if name is already defined in the scope variables
+        of the given kind belong to.
+        '''
+        return name in (self.classScope if kind in ('STATIC', 'FIELD') else self.subroutineScope)
+
+    def varCount(self, kind):
+        '''ST.varCount(str) -> int
+
+        Returns the number of variables of the given kind defined in
+        the current scope.
+        '''
+        return self.counts[kind]
+
+    def lookup(self, name):
+        '''ST.lookup(str) -> tuple
+
+        Returns the (kind, type, index) of the variable name in the
+        innermost scope that defines it, or None if it is not defined.
+        '''
+        return self.subroutineScope.get(name) or self.classScope.get(name)
+
+    def kindOf(self, name):
+        '''ST.kindOf(str) -> str
+
+        Returns the kind of the variable name, or None if it is not
+        defined.
+        '''
+        entry = self.lookup(name)
+        return entry and entry[0]
+
+    def typeOf(self, name):
+        '''ST.typeOf(str) -> str
+
+        Returns the type of the variable name.
+        '''
+        return self.lookup(name)[1]
+
+    def indexOf(self, name):
+        '''ST.indexOf(str) -> int
+
+        Returns the index of the variable name.
+        '''
+        return self.lookup(name)[2]
+
+class NullBackend(object):
+    '''Receives the parse tree and the VM code of a class from a
+    CompilationEngine and drops them, for runs that only check the
+    syntax. The other backends derive from it; every backend is created
+    with the name of the file it writes to and takes the same calls.'''
+
+    #True if the backend takes the VM code, for which every variable
+    #must be declared
+    CODE = False
+
+    def __init__(self, fname):
+        '''Gets ready to write to the file at fname.'''
+        self.fname = fname
+
+    def __str__(self):
+        return 'NullBackend object.'
+
+    def openNode(self, name):
+        '''B.openNode(str) -> None
+
+        Starts a construct of the grammar, such as class or expression.
+        '''
+
+    def closeNode(self, name):
+        '''B.closeNode(str) -> None
+
+        Ends the construct started by the matching openNode().
+        '''
+
+    def token(self, kind, text):
+        '''B.token(str, str) -> None
+
+        Adds a token of the type kind (see JackTokenizer.tokenType()) to
+        the current construct.
+        '''
+
+    def writePush(self, segment, index):
+        '''B.writePush(str, int) -> None
+
+        Adds a VM push command.
+        '''
+
+    def writePop(self, segment, index):
+        '''B.writePop(str, int) -> None
+
+        Adds a VM pop command.
+        '''
+
+    def writeArithmetic(self, command):
+        '''B.writeArithmetic(str) -> None
+
+        Adds a VM arithmetic command, such as add or not.
+        '''
+
+    def writeLabel(self, label):
+        '''B.writeLabel(str) -> None
+
+        Adds a VM label command.
+        '''
+
+    def writeGoto(self, label):
+        '''B.writeGoto(str) -> None
+
+        Adds a VM goto command.
+        '''
+
+    def writeIf(self, label):
+        '''B.writeIf(str) -> None
+
+        Adds a VM if-goto command.
+        '''
+
+    def writeCall(self, name, nArgs):
+        '''B.writeCall(str, int) -> None
+
+        Adds a VM call command.
+        '''
+
+    def writeFunction(self, name, nLocals):
+        '''B.writeFunction(str, int) -> None
+
+        Adds a VM function command.
+        '''
+
+    def writeReturn(self):
+        '''B.writeReturn() -> None
+
+        Adds a VM return command.
+        '''
+
+    def close(self):
+        '''B.close() -> None
+
+        Writes the output file, if the backend has one.
+        '''
+
+class XmlBackend(NullBackend):
+    '''Writes the parse tree as XML, one element per construct and per
+    token. The output is buffered and written in one go by close().'''
+
+    TAGS = {'KEYWORD': 'keyword', 'SYMBOL': 'symbol', 'IDENTIFIER': 'identifier',
+            'INT_CONST': 'integerConstant', 'STRING_CONST': 'stringConstant'}
+
+    ESCAPES = str.maketrans({'<': '&lt;', '>': '&gt;', '&': '&amp;', '"': '&quot;'})
+
+    #The element of every keyword and symbol, escaped once and for all
+    ELEMENTS = {text: '<keyword> ' + text + ' </keyword>\n' for text in JackTokenizer.KEYWORDS}
+    for text in '{}()[].,;+-*/&|<>=~':
+        ELEMENTS[text] = '<symbol> ' + text.translate(ESCAPES) + ' </symbol>\n'
+    del text
+
+    def __init__(self, fname):
+        '''Gets ready to write to the file at fname.'''
+        NullBackend.__init__(self, fname)
+        self.parts = []
+
+    def __str__(self):
+        return 'XmlBackend object.'
+
+    def openNode(self, name):
+        self.parts.append('<' + name + '>\n')
+
+    def closeNode(self, name):
+        self.parts.append('</' + name + '>\n')
+
+    def token(self, kind, text):
+        if kind == 'KEYWORD' or kind == 'SYMBOL':
+            self.parts.append(self.ELEMENTS[text])
+        else:
+            tag = self.TAGS[kind]
+            self.parts.append('<' + tag + '> ' + text.translate(self.ESCAPES) + ' </' + tag + '>\n')
+
+    def close(self):
+        with open(self.fname, 'w') as xmlFile:
+            xmlFile.write(''.join(self.parts))
+
+class JsonBackend(NullBackend):
+    '''Writes the parse tree as compact JSON. Every construct is an
+    object {"type": name, "children": [...]} and every token a
+    [tag, text] pair, with the tags of XmlBackend.'''
+
+    def __init__(self, fname):
+        '''Gets ready to write to the file at fname.'''
+        NullBackend.__init__(self, fname)
+        self.root = {'type': None, 'children': []}
+        self._open = [self.root]
+
+    def __str__(self):
+        return 'JsonBackend object.'
+
+    def openNode(self, name):
+        node = {'type': name, 'children': []}
+        self._open[-1]['children'].append(node)
+        self._open.append(node)
+
+    def closeNode(self, name):
+        self._open.pop()
+
+    def token(self, kind, text):
+        self._open[-1]['children'].append([XmlBackend.TAGS[kind], text])
+
+    def close(self):
+        #dumps() encodes in C, where dump() would write it piece by piece
+        text = json.dumps(self.root['children'][0], separators=(',', ':'))
+        with open(self.fname, 'w') as jsonFile:
+            jsonFile.write(text)
+
+class VmBackend(NullBackend):
+    '''Writes the VM code of the class, and drops its parse tree. The
+    output is buffered and written in one go by close().'''
+
+    CODE = True
+
+    def __init__(self, fname):
+        '''Gets ready to write to the file at fname.'''
+        NullBackend.__init__(self, fname)
+        self.lines = []
+
+    def __str__(self):
+        return 'VmBackend object.'
+
+    def writePush(self, segment, index):
+        self.lines.append('push {} {}'.format(segment, index))
+
+    def writePop(self, segment, index):
+        self.lines.append('pop {} {}'.format(segment, index))
+
+    def writeArithmetic(self, command):
+        self.lines.append(command)
+
+    def writeLabel(self, label):
+        self.lines.append('label ' + label)
+
+    def writeGoto(self, label):
+        self.lines.append('goto ' + label)
+
+    def writeIf(self, label):
+        self.lines.append('if-goto ' + label)
+
+    def writeCall(self, name, nArgs):
+        self.lines.append('call {} {}'.format(name, nArgs))
+
+    def writeFunction(self, name, nLocals):
+        self.lines.append('function {} {}'.format(name, nLocals))
+
+    def writeReturn(self):
+        self.lines.append('return')
+
+    def close(self):
+        self.lines.append('')
+        with open(self.fname, 'w') as vmFile:
+            vmFile.write('\n'.join(self.lines))
+
+#The backend of every output format, and the extension of its files
+BACKENDS = {'vm': (VmBackend, '.vm'), 'xml': (XmlBackend, '.xml'),
+            'json': (JsonBackend, '.json'), 'null': (NullBackend, None)}
+
 class CompilationEngine(object):
-    '''Effects the actual compilation output. Gets its input from a
-    JackTokenizer and emits its parsed structure into an output file.
-    '''
- 
-    def __init__(self,inputFile,outputFile):
-        '''Constructor - Creates a new compilation engine with inputFile and
-        outputFile. The next method called must be compileClass().
-        '''
-        self.infile = JackTokenizer(inputFile)
-        self.outFile = open(outputFile, 'w')
-        self.compileClass()
-         
-     
-    def compileClass(self):
-        '''CE.compileClass() -> None
- 
-        Compiles a complete class.'''
-        self.outFile.write("<class>\n")
-        if self.infile.currentToken == "class":
-            self.outFile.write("<keyword>class</keyword>\n")
-            self.infile.advance()
-            if self.infile.tokenType() == "IDENTIFIER":
-                self.outFile.write("<identifier>" + self.infile.currentToken + "</identifier>\n")
-                if self.infile.nextToken() == "{":
-                    self.outFile.write("<symbol> { </symbol>\n")
-                    self.infile.advance()
-                    while self.infile.currentToken != "}":
-                        if self.infile.nextToken() == "}":
-                            self.outFile.write("<symbol> } </symbol>\n")
-                            self.outFile.write("</class>\n")
-                            break
-                        self.compileClassVarDec()
-                        self.infile.advance()
-                        self.compileSubroutine()
-                else:
-                    print("Expected a { symbol after Identifier")
-            else:
-                print("Expected an IDENTIFIER")
-        else:
-            print("Expected Keyword class")
-     
-    def compileClassVarDec(self):
-        '''CE.compileClassVarDec() -> None
-         
-        Compiles a static declaration or a field declaration.
-        '''
-        if self.infile.currentToken == "static" or self.infile.currentToken == "field":
-            self.outFile.write("<classVarDec>\n")
-            self.outFile.write("<keyword> " + self.infile.currentToken + " </keyword>\n")
-            self.infile.advance()
-            if self.infile.tokenType() == "IDENTIFIER" or self.infile.currentToken in ["int","char","boolean"]:
-                if self.infile.tokenType() == "IDENTIFIER":
-                    self.outFile.write("<identifier> " + self.infile.currentToken + " </identifier>\n")
-                else:
-                    self.outFile.write("<keyword> " + self.infile.currentToken + " </keyword>\n")
-                 
-                while self.infile.nextToken() != ";":
-                    if self.infile.nextToken() == ",":
-                        self.infile.advance()
-                        self.outFile.write("<symbol> , </symbol>\n")
-                    self.infile.advance()
-                    if self.infile.tokenType() == "IDENTIFIER":
-                        self.outFile.write("<identifier> " + self.infile.currentToken + "</identifier>\n")
-                self.infile.advance()
-                if self.infile.currentToken == ";":
-                     
-                    self.outFile.write("<symbol> ; </symbol>\n")
-                     
-                    self.outFile.write("</classVarDec>\n")
-         
-                     
- 
-    def compileSubroutine(self):
-        '''CE.compileSubroutine() -> None
- 
-        Compiles a complete method, function, or constructor.
-        '''
-         
-        if self.infile.currentToken in ["constructor","method","function"]:
-            self.outFile.write("<subroutineDec>\n")
-            self.outFile.write("<keyword> " + self.infile.currentToken + " </keyword>\n")
-            self.infile.advance()
-            if self.infile.tokenType() == "IDENTIFIER" or self.infile.currentToken in ["int","char","boolean", "void"]:
-                if self.infile.tokenType() == "IDENTIFIER":
-                    self.outFile.write("<identifier> " + self.infile.currentToken + " </identifier>\n")
-                else:
-                    self.outFile.write("<keyword> " + self.infile.currentToken + " </keyword>\n")
-                self.infile.advance()
-                if self.infile.tokenType() == "IDENTIFIER":
-                    self.outFile.write("<identifier> " + self.infile.currentToken + "</identifier>\n")
-                    self.outFile.write("<symbol> ( </symbol>\n")
-                    self.infile.advance()
-                self.compileParameterList()
-                self.outFile.write("<subroutineBody>\n")
-                if self.infile.nextToken() == "{":
-                    self.outFile.write("<symbol> { </symbol>\n")
-            self.compileVarDec()
-            self.compileStatements()
-            if self.infile.nextToken() == "}":
-                self.outFile.write("<symbol> } </symbol>\n")
-                self.infile.advance()
-                if self.infile.nextToken() in ["method", "function", "constructor", "}"]:
-                    self.outFile.write("</subroutineBody>\n")
-                    self.outFile.write("</subroutineDec>\n")
-                    self.infile.advance()
-                          
- 
-    def compileParameterList(self):
-        '''CE.compileParameterList() -> None
- 
-        Compiles a (possible empty) parameter list not including the
-        enclosing "()".
-        '''
-         
-         
-        self.outFile.write("<parameterList>\n")
-         
-        while self.infile.nextToken() != ")":
-            print(self.infile.currentToken)
-            if self.infile.nextToken() == ",":
-                self.infile.advance()
-                self.outFile.write("<symbol> , </symbol>\n")
-            self.infile.advance()
-            if self.infile.tokenType() == "IDENTIFIER" or self.infile.currentToken in ["int","char","boolean"]:
-                if self.infile.tokenType() == "IDENTIFIER":
-                    self.outFile.write("<identifier> " + self.infile.currentToken + "</identifier>\n")
-                else:
-                    self.outFile.write("<keyword> " + self.infile.currentToken + " </keyword>\n")
-                    #self.infile.advance()
-                if self.infile.tokenType() == "IDENTIFER":
-                    self.outFile.write("<identifier> " + self.infile.advance() + "</identifier>\n")
-                else:
-                    self.infile.advance()
-                    if self.infile.tokenType() == "IDENTIFIER":
-                        self.outFile.write("<identifier> " + self.infile.currentToken + "</identifier>\n")
-        if self.infile.nextToken() == ")":
-            self.outFile.write("</parameterList>\n")
-            self.outFile.write("<symbol> ) </symbol>\n")
-            self.infile.advance()                    
-        self.outFile.write("</parameterList>\n")
-         
-    def compileVarDec(self):
-        '''CE.compileVarDec() -> None
- 
-        Compiles a var declaration.
-        '''
-        self.infile.advance()
-        if self.infile.currentToken == "var":
-            self.outFile.write("<varDec>\n")
-            sefl.outFile.write("<keyword>" + self.infile.currentToken + "</keyword>")
-            self.infile.advance()
-            if self.infile.tokenType() == "IDENTIFIER" or self.infile.currentToken in ["int","char","boolean"]:
-                if self.infile.tokenType() == "IDENTIFIER":
-                    self.outFile.write("<identifier> " + self.infile.currentToken + " </identifier>\n")
-                else:
-                    self.outFile.write("<keyword> " + self.infile.currentToken + "</keyword>\n")
-                while self.infile.nextToken() != ";":
-                    if self.infile.nextToken == ",":
-                        self.outFile.write("<symbol> , </symbol>\n")
-                        self.infile.advance()
-                    else:
-                        self.infile.advance()
-                    if self.infile.tokenType() == "IDENTIFIER":
-                        self.outFile.write("<identifier> " + self.infile.currentToken + " </identifier>\n")
-                if self.infile.currentToken == ";":
-                    self.outFile.write("<keyword> ; </keyword>\n")
-                    self.outFile.write("</varDec>\n")
-         
- 
-    def compileStatements(self):
-        '''CE.compileStatements() -> None
- 
-        Compiles a sequence of statement not including the enclosing "{}".
-        '''
-         
-        self.outFile.write("<statements>\n")
-        while self.compileLet() or self.compileDo() or self.compileIf() or self.compileWhile():
-            self.compileReturn()
-        self.outFile.write("</statements>\n")
- 
-    def compileDo(self):
-        '''CE.compileDo() -> None
- 
-        Compiles a do statement.
-        '''
-        self.infile.advance()
-        if self.infile.currentToken == "do":
-            self.outFile.write("<doStatement>\n")
-            self.outFile.write("<keyword>" + self.infile.currentToken + "</keyword>\n")
-            self.CompileSubroutine()
-            if self.infile.nextToken() == ";":
-                self.outFile.write("<symbol> ; </symbol>\n")
-                self.outFile.write("</doStatment>\n")
- 
-    def compileLet(self):
-        '''CE.compileLet() -> None
- 
-        Compiles a let statement.
-        '''
-        #NOT COMPLETE
-        self.infile.advance()
-        if self.infile.currentToken == "let":
-            self.outFile.write("<letStatement>\n")
-            self.outFile.write("<keyword> let </keyword>\n")
-            self.infile.advance()
-            if self.infile.tokenType() == "IDENTIFIER":
-                self.outFile.write("<identifier>" + self.infile.currentToken +"</identifier>\n")
-                if self.infile.nextToken == "[":
-                    self.outFile.write("<symbol> [ </symbol>\n")
-                    self.outFile.write("<identifier>" + self.infile.currentToken +"</identifier>\n")
-                                         
-                     
-    def compileWhile(self):
-        '''CE.compileWhile() -> None
- 
-        Compiles a while statement.
-        '''
-        self.infile.advance()
-        if self.infile.currentToken == "while":
-            self.outFile.write("<whileStatement>\n")
-            self.outFile.write("</keyword>" + self.infile.currentToken+ "</keyword>\n")
-            if self.infile.nextToken() == "(":
-                self.outFile.write("<symbol> ( </symbol>\n")
-                self.compileExpressionList()
-                if self.infile.nextToken() == ")":
-                    self.outFile.write("<symbol> ) </symbol>\n")
-                    self.outFile.write("<symbol> { </symbol>\n")
-                    self.compileStatements()
-                    if self.infile.nextToken() == "}":
-                        self.outFile.write("<symbol> } </symbol>\n")
-            self.outFile.write("</whileStatements>\n")
-             
-    def compileReturn(self):
-        '''CE.compileReturn() -> None
- 
-        Compiles a return statement.
-        '''
-        self.infile.advance()
-        if self.infile.currentToken == "return":
-            self.outfile.write("<returnStatement>\n")
-            self.outfile.write("<keyword>" + self.infilecurrentToken + "</keyword>")
-            if self.infile.nextToken() != ";":
-                self.compileExpression()
-            elif self.infile.nextToken() == ";":
-                self.outFile.write("<symbol> ; </symbol>\n")
-                self.outFile.write("</returnStatement>\n")
-             
-             
-    def compileIf(self):
-        '''CE.compileIf() -> None
- 
-        Compiles an if statement possibly with a trailing else clause.
-        '''
-        self.infile.advance()
-        if self.infile.currentToken == "if":
-            self.outFile.write("<ifStatement\n>")
-            self.outFile.write("<keyword>\n")
-            if self.infile.nextToken() == "(":
-                self.outFile.write("<symbol> ( </symbol>\n")
-                self.infile.advance()
-                self.compileExpressionList()
-                if self.infile.nextToken in [")", "{"]:
-                    self.outFile.write("<symbol> ) </symbol>\n")
-                    self.outFile.write("<symbol> { </symbol>\n")
-                    self.compileStatements()
-                    if self.infile.nextToken() == "}":
-                        self.outFile.write("<symbol> } </symbol>")
-            self.outFile.write("</ifStatement>")
-             
-     
-    def compileExpression(self):
-        '''CE.compileExpression() -> None
-         
-        Compiles an expression.
-        '''
-        self.outFile.write("<expression>\n")
-        self.compileTerm()
-        self.infile.advance()
-        while self.infile.tokenType == "SYMBOL":
-            symbol = ""
-            if self.infile.currentToken() == "<":
-                symbol = "&lt;"
-            elif self.infile.currentToken() == ">":
-                symbol = "&gt;"
-            elif self.infile.currentToken() == "&":
-                symbol = "&amp;"
-            elif self.infile.currentToken() == "\"":
-                symbol = "&quot;"
-            self.outfile.write("<symbol>" + symbol + "</symbol>\n")
-        self.compileTerm()
-        self.outFile.write("</expression>\n")
- 
-    def compileTerm(self):
-        '''CE.compileTerm() -> None
- 
-        Compiles a term. Uses lookahead to decide between alternative
-        parsing rules. If the current token is an indentifier, a
-        look=ahead token of "[", "(", or "." distinguish between a
-        variable, array, and subroutine call. Any other token is not
-        part of this term and should not be advanced over.
-        '''
-        #Not complete 
-        self.outFile.write("<term>\n")
-        self.infile.advance()
-        if self.infile.currentToken in ["true","false","this","null"]:
-            self.outFile.write("<keyword>" + self.infile.currentToken + "</keyword>\n")
-        elif self.infile.currentToken == "(":
-            self.outFile.write("<symbol>(</symbol>\n")
-            self.compileExpression()
-            if self.infile.nextToken() == ")":
-                self.outFile.write("<symbol> ) </symbol>")
-        elif self.infile.currentToken in ["-", "~"]:
-            self.outFile.write("<symbol>" + self.infile.nextToken() + "</symbol>\n")
-        elif self.infile.tokenType == "STRING_CONST":
-            self.outFile.write("<stringConstant>" + self.infile.currentToken + "</stringConstant>")
-        elif self.infile.tokenType() == "INT_CONST":
-            self.outFile.write("<integerConstant>" + self.infile.currentToken + "</integerConstant>") 
-        self.outFile.write("</term>")
-    def compileExpressionList(self):
-        '''CE.compileExpressionList() -> None
- 
-        Compiles a (possibly empty) comma separated list of expressions.
-        '''
-        while self.infile.nextToken() != "{":
-            self.compileExpression()
- 
+    '''Effects the actual compilation output. Gets its input from a
+    JackTokenizer and passes its parsed structure to a backend (see
+    NullBackend): every construct of the Jack grammar is opened before
+    its parts and closed after them, with its tokens in between. The
+    VM code of every construct goes to the backend in the same pass,
+    with the variables resolved through a SymbolTable. Raises
+    ValueError, located in the source, on a syntax error, and, if the
+    backend takes the VM code, on an undeclared or redeclared variable.
+    '''
+
+    #Binary operators, one of which may follow every term of an
+    #expression, and the VM code of each
+    OPERATORS = {'+': ('add',), '-': ('sub',), '&': ('and',), '|': ('or',),
+                 '<': ('lt',), '>': ('gt',), '=': ('eq',),
+                 '*': ('call', 'Math.multiply'), '/': ('call', 'Math.divide')}
+
+    STATEMENTS = frozenset(['let', 'if', 'while', 'do', 'return'])
+
+    def __init__(self,inputFile,backend):
+        '''Constructor - Creates a new compilation engine with inputFile and
+        the backend the parse tree goes to, and compiles the class.
+        '''
+        self.infile = JackTokenizer(inputFile)
+        self.backend = backend
+        self.symbols = SymbolTable()
+        self.className = None
+        #Numbers of the next if and while statements of the subroutine,
+        #which make their labels unique
+        self._ifs = 0
+        self._whiles = 0
+        #True once the last token has been passed to the backend
+        self._done = len(self.infile) == 0
+        self.compileClass()
+        if not self._done:
+            self._error('end of file')
+
+    def __str__(self):
+        return 'CompilationEngine object.'
+
+    def close(self):
+        '''CE.close() -> None
+
+        Has the backend write its output.'''
+        self.backend.close()
+
+    def _peek(self):
+        '''CE._peek() -> str
+
+        Returns the current token, or None at the end of the file or if
+        it is a string constant, which could look like any other token.
+        '''
+        if self._done or self.infile.tokenType() == 'STRING_CONST':
+            return None
+        return self.infile.currentToken
+
+    def _peekSymbol(self):
+        '''CE._peekSymbol() -> str
+
+        Returns the token after the current one if it is a symbol, and
+        None otherwise.
+        '''
+        if self.infile.typeAt(self.infile.position + 1) == 'SYMBOL':
+            return self.infile.lookAhead(1)
+        return None
+
+    def _error(self, expected):
+        '''CE._error(str) -> None
+
+        Raises a ValueError saying what was expected where the current
+        token is.
+        '''
+        if self._done:
+            raise ValueError('{}: expected {}, found end of file'.format(self.infile.name, expected))
+        line, column = self.infile.location()
+        raise ValueError('{}:{}:{}: expected {}, found {!r}'.format(
+            self.infile.name, line, column, expected, self.infile.currentToken))
+
+    def _emit(self):
+        '''CE._emit() -> str
+
+        Passes the current token to the backend, moves past it and
+        returns it.
+        '''
+        text = self.infile.currentToken
+        self.backend.token(self.infile.tokenType(), text)
+        if self.infile.hasMoreTokens():
+            self.infile.advance()
+        else:
+            self._done = True
+        return text
+
+    def _expect(self, *texts):
+        '''CE._expect(str, ...) -> str
+
+        Emits the current token if it is one of texts, and raises a
+        syntax error otherwise.
+        '''
+        if self._peek() not in texts:
+            self._error(' or '.join(repr(text) for text in texts))
+        return self._emit()
+
+    def _expectIdentifier(self, what):
+        '''CE._expectIdentifier(str) -> str
+
+        Emits the current token if it is an identifier, and raises a
+        syntax error expecting what otherwise.
+        '''
+        if self._done or self.infile.tokenType() != 'IDENTIFIER':
+            self._error(what)
+        return self._emit()
+
+    def _expectType(self, *keywords):
+        '''CE._expectType(str, ...) -> str
+
+        Emits the current token if it is a type (int, char, boolean or
+        a class name) or one of the other keywords given.
+        '''
+        if self._peek() in ('int', 'char', 'boolean') + keywords:
+            return self._emit()
+        return self._expectIdentifier('a type')
+
+    def _declare(self, type, kind):
+        '''CE._declare(str, str) -> str
+
+        Emits the current token as the name of a new variable of the
+        given type and kind, defines it in the symbol table and returns
+        it. Raises a syntax error if it is not an identifier or, if the
+        backend takes the VM code, it is already defined in its scope.
+        '''
+        if self._done or self.infile.tokenType() != 'IDENTIFIER':
+            self._error('a variable name')
+        name = self.infile.currentToken
+        if self.backend.CODE and self.symbols.defined(name, kind):
+            self._error('a variable name not declared before')
+        self.symbols.define(name, type, kind)
+        return self._emit()
+
+    def _variable(self):
+        '''CE._variable() -> tuple
+
+        Returns the (segment, index) of the variable that is the current
+        token. Raises a syntax error if it is not declared and the
+        backend takes the VM code.
+        '''
+        entry = self.symbols.lookup(self.infile.currentToken)
+        if entry is None:
+            if self.backend.CODE:
+                self._error('a declared variable')
+            return 'local', 0
+        return SymbolTable.SEGMENTS[entry[0]], entry[2]
+
+    def compileClass(self):
+        '''CE.compileClass() -> None
+
+        Compiles a complete class.'''
+        self.backend.openNode('class')
+        self._expect('class')
+        self.className = self._expectIdentifier('a class name')
+        self._expect('{')
+        while self._peek() in ('static', 'field'):
+            self.compileClassVarDec()
+        while self._peek() in ('constructor', 'function', 'method'):
+            self.compileSubroutine()
+        self._expect('}')
+        self.backend.closeNode('class')
+
+    def compileClassVarDec(self):
+        '''CE.compileClassVarDec() -> None
+
+        Compiles a static declaration or a field declaration.
+        '''
+        self.backend.openNode('classVarDec')
+        kind = self._expect('static', 'field').upper()
+        type = self._expectType()
+        self._declare(type, kind)
+        while self._peek() == ',':
+            self._emit()
+            self._declare(type, kind)
+        self._expect(';')
+        self.backend.closeNode('classVarDec')
+
+    def compileSubroutine(self):
+        '''CE.compileSubroutine() -> None
+
+        Compiles a complete method, function, or constructor.
+        '''
+        self.backend.openNode('subroutineDec')
+        self.symbols.startSubroutine()
+        self._ifs = 0
+        self._whiles = 0
+        kind = self._expect('constructor', 'function', 'method')
+        if kind == 'method':
+            #The object is the hidden first argument of a method
+            self.symbols.define('this', self.className, 'ARG')
+        self._expectType('void')
+        name = self._expectIdentifier('a subroutine name')
+        self._expect('(')
+        self.compileParameterList()
+        self._expect(')')
+        self.backend.openNode('subroutineBody')
+        self._expect('{')
+        while self._peek() == 'var':
+            self.compileVarDec()
+        self.backend.writeFunction(self.className + '.' + name, self.symbols.varCount('VAR'))
+        if kind == 'constructor':
+            self.backend.writePush('constant', self.symbols.varCount('FIELD'))
+            self.backend.writeCall('Memory.alloc', 1)
+            self.backend.writePop('pointer', 0)
+        elif kind == 'method':
+            self.backend.writePush('argument', 0)
+            self.backend.writePop('pointer', 0)
+        self.compileStatements()
+        self._expect('}')
+        self.backend.closeNode('subroutineBody')
+        self.backend.closeNode('subroutineDec')
+
+    def compileParameterList(self):
+        '''CE.compileParameterList() -> None
+
+        Compiles a (possible empty) parameter list not including the
+        enclosing "()".
+        '''
+        self.backend.openNode('parameterList')
+        if self._peek() != ')':
+            self._declare(self._expectType(), 'ARG')
+            while self._peek() == ',':
+                self._emit()
+                self._declare(self._expectType(), 'ARG')
+        self.backend.closeNode('parameterList')
+
+    def compileVarDec(self):
+        '''CE.compileVarDec() -> None
+
+        Compiles a var declaration.
+        '''
+        self.backend.openNode('varDec')
+        self._expect('var')
+        type = self._expectType()
+        self._declare(type, 'VAR')
+        while self._peek() == ',':
+            self._emit()
+            self._declare(type, 'VAR')
+        self._expect(';')
+        self.backend.closeNode('varDec')
+
+    def compileStatements(self):
+        '''CE.compileStatements() -> None
+
+        Compiles a sequence of statement not including the enclosing "{}".
+        '''
+        self.backend.openNode('statements')
+        while self._peek() in self.STATEMENTS:
+            statement = self._peek()
+            if statement == 'let':
+                self.compileLet()
+            elif statement == 'if':
+                self.compileIf()
+            elif statement == 'while':
+                self.compileWhile()
+            elif statement == 'do':
+                self.compileDo()
+            else:
+                self.compileReturn()
+        self.backend.closeNode('statements')
+
+    def compileDo(self):
+        '''CE.compileDo() -> None
+
+        Compiles a do statement.
+        '''
+        self.backend.openNode('doStatement')
+        self._expect('do')
+        self._compileSubroutineCall()
+        self._expect(';')
+        #The value every subroutine returns is dropped
+        self.backend.writePop('temp', 0)
+        self.backend.closeNode('doStatement')
+
+    def compileLet(self):
+        '''CE.compileLet() -> None
+
+        Compiles a let statement.
+        '''
+        self.backend.openNode('letStatement')
+        self._expect('let')
+        if self._done or self.infile.tokenType() != 'IDENTIFIER':
+            self._error('a variable name')
+        segment, index = self._variable()
+        self._emit()
+        if self._peek() == '[':
+            self._emit()
+            self.compileExpression()
+            self._expect(']')
+            self.backend.writePush(segment, index)
+            self.backend.writeArithmetic('add')
+            self._expect('=')
+            self.compileExpression()
+            #The value is kept aside while that is pointed at the element,
+            #as the expression may have used that itself
+            self.backend.writePop('temp', 0)
+            self.backend.writePop('pointer', 1)
+            self.backend.writePush('temp', 0)
+            self.backend.writePop('that', 0)
+        else:
+            self._expect('=')
+            self.compileExpression()
+            self.backend.writePop(segment, index)
+        self._expect(';')
+        self.backend.closeNode('letStatement')
+
+    def compileWhile(self):
+        '''CE.compileWhile() -> None
+
+        Compiles a while statement.
+        '''
+        self.backend.openNode('whileStatement')
+        number = str(self._whiles)
+        self._whiles = self._whiles + 1
+        self.backend.writeLabel('WHILE_EXP' + number)
+        self._expect('while')
+        self._expect('(')
+        self.compileExpression()
+        self._expect(')')
+        self.backend.writeArithmetic('not')
+        self.backend.writeIf('WHILE_END' + number)
+        self._expect('{')
+        self.compileStatements()
+        self._expect('}')
+        self.backend.writeGoto('WHILE_EXP' + number)
+        self.backend.writeLabel('WHILE_END' + number)
+        self.backend.closeNode('whileStatement')
+
+    def compileReturn(self):
+        '''CE.compileReturn() -> None
+
+        Compiles a return statement.
+        '''
+        self.backend.openNode('returnStatement')
+        self._expect('return')
+        if self._peek() != ';':
+            self.compileExpression()
+        else:
+            #void subroutines return 0, which the caller drops
+            self.backend.writePush('constant', 0)
+        self._expect(';')
+        self.backend.writeReturn()
+        self.backend.closeNode('returnStatement')
+
+    def compileIf(self):
+        '''CE.compileIf() -> None
+
+        Compiles an if statement possibly with a trailing else clause.
+        '''
+        self.backend.openNode('ifStatement')
+        number = str(self._ifs)
+        self._ifs = self._ifs + 1
+        self._expect('if')
+        self._expect('(')
+        self.compileExpression()
+        self._expect(')')
+        self.backend.writeIf('IF_TRUE' + number)
+        self.backend.writeGoto('IF_FALSE' + number)
+        self.backend.writeLabel('IF_TRUE' + number)
+        self._expect('{')
+        self.compileStatements()
+        self._expect('}')
+        if self._peek() == 'else':
+            self.backend.writeGoto('IF_END' + number)
+            self.backend.writeLabel('IF_FALSE' + number)
+            self._emit()
+            self._expect('{')
+            self.compileStatements()
+            self._expect('}')
+            self.backend.writeLabel('IF_END' + number)
+        else:
+            self.backend.writeLabel('IF_FALSE' + number)
+        self.backend.closeNode('ifStatement')
+
+    def compileExpression(self):
+        '''CE.compileExpression() -> None
+
+        Compiles an expression.
+        '''
+        self.backend.openNode('expression')
+        self.compileTerm()
+        while self._peek() in self.OPERATORS:
+            code = self.OPERATORS[self._emit()]
+            self.compileTerm()
+            if len(code) == 1:
+                self.backend.writeArithmetic(code[0])
+            else:
+                self.backend.writeCall(code[1], 2)
+        self.backend.closeNode('expression')
+
+    def compileTerm(self):
+        '''CE.compileTerm() -> None
+
+        Compiles a term. Uses lookahead to decide between alternative
+        parsing rules. If the current token is an indentifier, a
+        look=ahead token of "[", "(", or "." distinguish between a
+        variable, array, and subroutine call. Any other token is not
+        part of this term and should not be advanced over.
+        '''
+        self.backend.openNode('term')
+        kind = None if self._done else self.infile.tokenType()
+        token = self._peek()
+        if kind == 'INT_CONST':
+            if int(token) > 32767:
+                self._error('an integer constant of at most 32767')
+            self.backend.writePush('constant', int(self._emit()))
+        elif kind == 'STRING_CONST':
+            text = self._emit()
+            self.backend.writePush('constant', len(text))
+            self.backend.writeCall('String.new', 1)
+            for character in text:
+                self.backend.writePush('constant', ord(character))
+                self.backend.writeCall('String.appendChar', 2)
+        elif token in ('true', 'false', 'null', 'this'):
+            self._emit()
+            if token == 'this':
+                self.backend.writePush('pointer', 0)
+            else:
+                self.backend.writePush('constant', 0)
+                if token == 'true':
+                    self.backend.writeArithmetic('not')
+        elif token == '(':
+            self._emit()
+            self.compileExpression()
+            self._expect(')')
+        elif token in ('-', '~'):
+            self._emit()
+            self.compileTerm()
+            self.backend.writeArithmetic('neg' if token == '-' else 'not')
+        elif kind == 'IDENTIFIER':
+            following = self._peekSymbol()
+            if following in ('(', '.'):
+                self._compileSubroutineCall()
+            else:
+                segment, index = self._variable()
+                self._emit()
+                if following == '[':
+                    self._emit()
+                    self.compileExpression()
+                    self._expect(']')
+                    self.backend.writePush(segment, index)
+                    self.backend.writeArithmetic('add')
+                    self.backend.writePop('pointer', 1)
+                    self.backend.writePush('that', 0)
+                else:
+                    self.backend.writePush(segment, index)
+        else:
+            self._error('an expression')
+        self.backend.closeNode('term')
+
+    def _compileSubroutineCall(self):
+        '''CE._compileSubroutineCall() -> None
+
+        Compiles a call of a subroutine of this class, or of a class or
+        an object named by the first identifier. A method gets the
+        object it is called on as its first argument: this, or the
+        variable named by the first identifier.
+        '''
+        name = self._expectIdentifier('a subroutine, class or variable name')
+        nArgs = 0
+        if self._peek() == '.':
+            entry = self.symbols.lookup(name)
+            if entry is not None:
+                self.backend.writePush(SymbolTable.SEGMENTS[entry[0]], entry[2])
+                nArgs = 1
+                name = entry[1]
+            self._emit()
+            name = name + '.' + self._expectIdentifier('a subroutine name')
+        else:
+            self.backend.writePush('pointer', 0)
+            nArgs = 1
+            name = self.className + '.' + name
+        self._expect('(')
+        nArgs = nArgs + self.compileExpressionList()
+        self._expect(')')
+        self.backend.writeCall(name, nArgs)
+
+    def compileExpressionList(self):
+        '''CE.compileExpressionList() -> int
+
+        Compiles a (possibly empty) comma separated list of expressions
+        and returns the number of expressions.
+        '''
+        self.backend.openNode('expressionList')
+        count = 0
+        if self._peek() != ')':
+            self.compileExpression()
+            count = 1
+            while self._peek() == ',':
+                self._emit()
+                self.compileExpression()
+                count = count + 1
+        self.backend.closeNode('expressionList')
+        return count
+
+class CompileCache(object):
+    '''Keeps an index, in a JSON file, of every class compiled without
+    errors in each format: the hash of its source and of each output
+    written for it. A class whose source is unchanged, and whose
+    outputs still hold what was written, need not be compiled again in
+    that format. The output of a class only depends on its own source,
+    as calls to other classes are compiled from their names alone, so
+    no other class can make it stale. Any change to the compiler
+    invalidates the whole index.
+    '''
+
+    def __init__(self, fname):
+        '''Loads the index at fname, if there is a valid one.'''
+        self.fname = Path(fname)
+        self.compiler = self.digest(__file__)
+        #Entries are keyed on 'class.format', such as 'Main.vm'
+        self.classes = {}
+        try:
+            with open(self.fname) as indexFile:
+                index = json.load(indexFile)
+            if index.get('compiler') == self.compiler:
+                self.classes = index['classes']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def __str__(self):
+        return 'CompileCache object.'
+
+    def digest(self, fname):
+        '''CC.digest(str) -> str
+
+        Returns the hash of the content of the file at fname, or None
+        if it cannot be read.
+        '''
+        try:
+            return hashlib.sha256(Path(fname).read_bytes()).hexdigest()
+        except OSError:
+            return None
+
+    def fresh(self, jackFile, format, digest, outputs):
+        '''CC.fresh(str, str, str, list) -> bool
+
+        Returns True if the Jack file at jackFile, whose source hashes
+        to digest, was compiled in format into the files in outputs and
+        they all still hold what was written to them.
+        '''
+        entry = self.classes.get(Path(jackFile).stem + '.' + format)
+        return (entry is not None and entry['source'] == digest
+                and sorted(entry['outputs']) == sorted(outputs)
+                and all(self.digest(output) == entry['outputs'][output] for output in outputs))
+
+    def update(self, jackFile, format, digest, outputs):
+        '''CC.update(str, str, str, list) -> None
+
+        Records that the Jack file at jackFile, whose source hashes to
+        digest, was compiled in format into the files in outputs.
+        '''
+        self.classes[Path(jackFile).stem + '.' + format] = {
+            'source': digest, 'outputs': {output: self.digest(output) for output in outputs}}
+
+    def forget(self, className, format):
+        '''CC.forget(str, str) -> None
+
+        Removes the class from the index of format, so that it is
+        compiled again.
+        '''
+        self.classes.pop(className + '.' + format, None)
+
+    def save(self):
+        '''CC.save() -> None
+
+        Writes the index to its file, through a temporary file.
+        '''
+        temporary = self.fname.with_suffix('.tmp' + str(os.getpid()))
+        with open(temporary, 'w') as indexFile:
+            json.dump({'compiler': self.compiler, 'classes': self.classes}, indexFile,
+                      indent=1, sort_keys=True)
+        os.replace(temporary, self.fname)
+
+def compileFile(jackFile, outputFile, format='vm'):
+    '''compileFile(str, str, str) -> str
+
+    Compiles the Jack file at jackFile into outputFile, in one of the
+    formats of BACKENDS (outputFile is None for 'null'). Returns None,
+    or a message if it could not be compiled. The output is written to
+    a temporary file that replaces outputFile once complete, so
+    outputFile never holds a partial output. Used by the worker
+    processes of --jobs.
+    '''
+    temporary = None
+    if outputFile is not None:
+        temporary = outputFile + '.tmp' + str(os.getpid())
+    try:
+        compiler = CompilationEngine(jackFile, BACKENDS[format][0](temporary))
+        compiler.close()
+        if temporary is not None:
+            os.replace(temporary, outputFile)
+        return None
+    except Exception as error:
+        if temporary is not None and os.path.exists(temporary):
+            os.remove(temporary)
+        if isinstance(error, ValueError):
+            return str(error)
+        #Anything else is a bug in the compiler, not in the Jack code
+        return '{}: {}: {}'.format(jackFile, type(error).__name__, error)
+
+def compileFiles(jackFiles, outputFiles, jobs=1, format='vm'):
+    '''compileFiles(list, list, int, str) -> list
+
+    Compiles each of the Jack files into the output file at the same
+    position of outputFiles with compileFile(), in a pool of jobs
+    processes if jobs is more than 1, and returns the results in the
+    order of jackFiles.
+    '''
+    if jobs > 1 and len(jackFiles) > 1:
+        #Several files per task, so that small files do not spend more
+        #time being sent to the workers than being compiled
+        chunk = max(1, len(jackFiles) // (4 * jobs))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(compileFile, jackFiles, outputFiles, repeat(format), chunksize=chunk))
+    return [compileFile(jackFile, outputFile, format)
+            for jackFile, outputFile in zip(jackFiles, outputFiles)]
+
+def compileProgram(jackFiles, options):
+    '''compileProgram(list, dict) -> list
+
+    Compiles the Jack files of a program, with the command line options
+    given, and returns the messages of the files that could not be
+    compiled. Each output is written next to its Jack file, with the
+    extension of the --format (see BACKENDS). With --cache, the files
+    whose source and outputs did not change since the last run are
+    skipped (see CompileCache). The index of the cache is kept in a
+    compile.cache file next to them.
+    '''
+    jobs = int(options.get('jobs', 1))
+    format = options.get('format', 'vm')
+    extension = BACKENDS[format][1]
+    outputFiles = [None] * len(jackFiles)
+    if extension is not None:
+        outputFiles = [str(Path(jackFile).with_suffix(extension)) for jackFile in jackFiles]
+    if 'cache' not in options or not jackFiles:
+        return [message for message in compileFiles(jackFiles, outputFiles, jobs, format)
+                if message is not None]
+    cache = CompileCache(Path(jackFiles[0]).parent / 'compile.cache')
+    digests = [cache.digest(jackFile) for jackFile in jackFiles]
+    #Classes removed since the last run, in every format
+    classNames = set(Path(jackFile).stem for jackFile in jackFiles)
+    for key in list(cache.classes):
+        className, _, keyFormat = key.rpartition('.')
+        if className not in classNames:
+            cache.forget(className, keyFormat)
+    outputs = [[outputFile] if outputFile else [] for outputFile in outputFiles]
+    pending = [i for i in range(len(jackFiles))
+               if not cache.fresh(jackFiles[i], format, digests[i], outputs[i])]
+    results = compileFiles([jackFiles[i] for i in pending], [outputFiles[i] for i in pending],
+                           jobs, format)
+    errors = []
+    for i, message in zip(pending, results):
+        if message is not None:
+            errors.append(message)
+            cache.forget(Path(jackFiles[i]).stem, format)
+        else:
+            cache.update(jackFiles[i], format, digests[i], outputs[i])
+    cache.save()
+    print('Cache: reused {} of {} files'.format(len(jackFiles) - len(pending), len(jackFiles)))
+    return errors
+
 def printUsage():
-    '''printUsage() -> None
-     
-    Prints infomration on how to invoke this program.
-    '''
-    print("Usage: {} dir".format(sys.argv[0]))
-    print("dir is the program directory - it contains the .jack file(s) to be compiled.")
- 
+    '''printUsage() -> None
+
+    Prints infomration on how to invoke this program.
+    '''
+    print("Usage: {} [options] dir".format(sys.argv[0]))
+    print("dir is the program directory - it contains the .jack file(s) to be compiled.")
+    print("options are")
+    print("\t--jobs=N\tcompile the files in N processes")
+    print("\t--format=vm|xml|json|null\twrite the VM code of every class (default),")
+    print("\t\t\tits parse tree as XML or compact JSON, or only check the syntax")
+    print("\t--cache\t\tskip the files that did not change since the last run")
+
+def getOptions():
+    '''getOptions() -> dict
+
+    Returns a dictionary of the options given on the command line. Each
+    --name=value maps name to value and each --name maps name to True.
+    '''
+    options = {}
+    for arg in sys.argv[1:]:
+        if arg.startswith('--'):
+            name, _, value = arg[2:].partition('=')
+            options[name] = value if value else True
+    return options
+
 def getFileNames():
-    '''getFileNames() -> list
- 
-    Returns a list containing the names of the Jack files in the given
-    directory name. Prints help and exits this program gracefully if
-    the program is invoked incorrectly.
-    '''
-    if len(sys.argv) != 2:
-        printUsage()
-        print('Invalid call:', str(sys.argv).translate(str.maketrans('','',"',[]")))
-        sys.exit()
-    p = Path(sys.argv[1])
-    if not p.is_dir():
-        printUsage()
-        print('{} is not a directory'.format(p))
-        sys.exit()
-    jackFiles = list(p.glob('*.jack'))
-    jackFiles = [str(f) for f in jackFiles]
-    return jackFiles
- 
+    '''getFileNames() -> list
+
+    Returns a list containing the names of the Jack files in the given
+    directory name. Prints help and exits this program gracefully if
+    the program is invoked incorrectly.
+    '''
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) != 1:
+        printUsage()
+        print('Invalid call:', str(sys.argv).translate(str.maketrans('','',"',[]")))
+        sys.exit()
+    p = Path(args[0])
+    if not p.is_dir():
+        printUsage()
+        print('{} is not a directory'.format(p))
+        sys.exit()
+    jackFiles = sorted(p.glob('*.jack'))
+    jackFiles = [str(f) for f in jackFiles]
+    return jackFiles
+
 def main():
-    '''Compiles the Jack program in the directory whose name is supplied
-    through the command line when invoking this program.
-    '''
-    jackFiles = getFileNames()
-    vmFiles = [s.replace('.jack','.vm') for s in jackFiles]
-    # jackFiles contains the names of the Jack files to be compiled.
-    # vmFiles contains the names of the corresponding vm files to be written to.
-    for jackFile in jackFiles:
-        index = jackFile.index('.jack')
-        xmlFile = jackFile[:index] + '.xml'
-        compiler = CompilationEngine(jackFile,xmlFile)
- 
+    '''Compiles the Jack program in the directory whose name is supplied
+    through the command line when invoking this program.
+    '''
+    options = getOptions()
+    jackFiles = getFileNames()
+    if options.get('format', 'vm') not in BACKENDS:
+        printUsage()
+        print('Invalid format:', options['format'], '\nAborting!')
+        sys.exit(1)
+    errors = compileProgram(jackFiles, options)
+    for message in errors:
+        print('Error:', message)
+    if errors:
+        sys.exit(1)
+
 if __name__ == '__main__':
-    '''Leave as is.'''
-    main()
\ No newline at end of file
+    '''Leave as is.'''
+    main()
\ No newline at end of file
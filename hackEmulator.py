@@ -0,0 +1,228 @@
+import sys
+from array import array
+from pathlib import Path
+from vmTranslator import COMP, assemble
+
+#Python expression of every computation on unsigned 16-bit values
+EXPRESSIONS = {'0': '0', '1': '1', '-1': '65535',
+               'D': 'D', 'A': 'A', '!D': 'D ^ 65535', '!A': 'A ^ 65535',
+               '-D': '-D & 65535', '-A': '-A & 65535',
+               'D+1': 'D + 1 & 65535', 'A+1': 'A + 1 & 65535',
+               'D-1': 'D - 1 & 65535', 'A-1': 'A - 1 & 65535',
+               'D+A': 'D + A & 65535', 'D-A': 'D - A & 65535', 'A-D': 'A - D & 65535',
+               'D&A': 'D & A', 'D|A': 'D | A'}
+for mnemonic in list(EXPRESSIONS):
+    if 'A' in mnemonic:
+        EXPRESSIONS[mnemonic.replace('A', 'M')] = EXPRESSIONS[mnemonic].replace('A', 'ram[A]')
+del mnemonic
+#The same expressions, keyed on the 7 computation bits of an instruction
+DECODE = {int(COMP[mnemonic], 2): expression for mnemonic, expression in EXPRESSIONS.items()}
+
+#Python condition under which each jump is taken, on the unsigned result v
+CONDITIONS = {1: '0 < v < 32768', 2: 'v == 0', 3: 'v < 32768', 4: 'v >= 32768',
+              5: 'v != 0', 6: 'v == 0 or v >= 32768', 7: 'True'}
+
+def loadProgram(fname):
+    '''loadProgram(str) -> tuple
+
+    Returns the machine code and symbol table (see assemble()) of the
+    .asm, .hack or .bin file at fname. The symbol table of machine code
+    is empty. Raises ValueError on an invalid .asm file (see
+    assemble()).
+    '''
+    if fname.endswith('.bin'):
+        code = array('H', Path(fname).read_bytes())
+        if sys.byteorder == 'little':
+            code.byteswap()
+        return list(code), {}
+    with open(fname) as programFile:
+        lines = programFile.read().split('\n')
+    if fname.endswith('.hack'):
+        return [int(line, 2) for line in lines if line.strip()], {}
+    return assemble(lines, fname)
+
+class Emulator(object):
+    '''Runs Hack machine code headlessly. Straight-line runs of
+    instructions are compiled to Python functions the first time they
+    are reached, and RAM and ROM are arrays of 16-bit words.
+
+    The program halts when it reaches a jump to itself, such as the
+    (INFINITE_LOOP) that CodeWriter.close() writes.
+    '''
+
+    #Longest run of instructions compiled into one function
+    BLOCK = 256
+
+    def __init__(self, code, symbols=None):
+        '''Loads the machine code into ROM and clears RAM.'''
+        self.rom = array('H', code)
+        self.ram = array('H', bytes(2 * 65536))
+        self.pc = 0
+        self.A = 0
+        self.D = 0
+        self.cycles = 0
+        #Number of times each compiled run was entered, when profiling
+        self.counts = {}
+        self._blocks = [None] * len(self.rom)
+        self._lengths = [0] * len(self.rom)
+        self._halts = set()
+        for address in range(len(self.rom) - 1):
+            if self.rom[address] == address and self._isJump(self.rom[address + 1]):
+                self._halts.add(address)
+        if symbols and 'INFINITE_LOOP' in symbols:
+            self._halts.add(symbols['INFINITE_LOOP'])
+
+    def __str__(self):
+        return 'Emulator object.'
+
+    def _isJump(self, word):
+        '''Returns True if word is an instruction that always jumps.'''
+        return word >= 0x8000 and (word & 7 == 7 or ((word >> 6) & 127 == 0b0101010 and word & 2))
+
+    def halted(self):
+        '''E.halted() -> bool
+
+        Returns True if the program has reached its end loop or run past
+        the end of ROM.
+        '''
+        return self.pc in self._halts or self.pc >= len(self.rom)
+
+    def _compile(self, start, limit):
+        '''E._compile(int, int) -> function
+
+        Compiles the instructions from the ROM address start up to the
+        first jump, halt address or end of ROM, at most limit of them,
+        into a Python function of (A, D) that returns (pc, A, D). Sets
+        the number of instructions in self._length.
+        '''
+        lines = ['def block(A, D):']
+        pc = start
+        while pc < len(self.rom) and pc - start < limit and (pc == start or pc not in self._halts):
+            word = self.rom[pc]
+            pc = pc + 1
+            if word < 0x8000:
+                lines.append('    A = ' + str(word))
+                continue
+            expression = DECODE[(word >> 6) & 127]
+            dest = (word >> 3) & 7
+            jump = word & 7
+            #A jump goes to the address A held before the instruction
+            target = 'A'
+            if jump and dest & 4:
+                lines.append('    t = A')
+                target = 't'
+            if dest in (1, 2, 4) and not jump:
+                register = {1: 'ram[A]', 2: 'D', 4: 'A'}[dest]
+                lines.append('    ' + register + ' = ' + expression)
+            else:
+                lines.append('    v = ' + expression)
+                if dest & 1:
+                    lines.append('    ram[A] = v')
+                if dest & 4:
+                    lines.append('    A = v')
+                if dest & 2:
+                    lines.append('    D = v')
+            if jump:
+                lines.append('    if ' + CONDITIONS[jump] + ':')
+                lines.append('        return ' + target + ', A, D')
+                break
+        lines.append('    return ' + str(pc) + ', A, D')
+        namespace = {'ram': self.ram}
+        exec('\n'.join(lines), namespace)
+        self._length = pc - start
+        return namespace['block']
+
+    def run(self, maxCycles=None, profile=False):
+        '''E.run(int, bool) -> int
+
+        Runs the program until it halts or maxCycles more instructions
+        have been executed, and returns the total number of instructions
+        executed so far. If profile is True, counts how many times each
+        compiled run is entered (see histogram()).
+        '''
+        blocks = self._blocks
+        lengths = self._lengths
+        halts = self._halts
+        counts = self.counts
+        end = len(self.rom)
+        pc, A, D, cycles = self.pc, self.A, self.D, self.cycles
+        limit = float('inf') if maxCycles is None else cycles + maxCycles
+        while pc < end and pc not in halts:
+            block = blocks[pc]
+            if block is None:
+                block = blocks[pc] = self._compile(pc, self.BLOCK)
+                lengths[pc] = self._length
+            length = lengths[pc]
+            key = pc
+            if cycles + length > limit:
+                #Finishes one instruction at a time, up to the limit
+                if cycles == limit:
+                    break
+                block = self._compile(pc, 1)
+                length = 1
+                key = (pc, 1)
+            if profile:
+                counts[key] = counts.get(key, 0) + 1
+            pc, A, D = block(A, D)
+            cycles = cycles + length
+        self.pc, self.A, self.D, self.cycles = pc, A, D, cycles
+        return cycles
+
+    def histogram(self):
+        '''E.histogram() -> dict
+
+        Returns a dictionary mapping every ROM address executed while
+        profiling to the number of times it was executed.
+        '''
+        histogram = {}
+        for start, count in self.counts.items():
+            if isinstance(start, tuple):
+                start, length = start
+            else:
+                length = self._lengths[start]
+            for address in range(start, start + length):
+                histogram[address] = histogram.get(address, 0) + count
+        return histogram
+
+    def signed(self, address):
+        '''E.signed(int) -> int
+
+        Returns the word at the RAM address as a signed integer.
+        '''
+        value = self.ram[address]
+        return value - 65536 if value >= 32768 else value
+
+def printUsage():
+    '''printUsage() -> None
+
+    Prints information on how to call this file.
+    '''
+    print("Usage: hackEmulator [options] program")
+    print("program is a .asm, .hack or .bin file")
+    print("options are")
+    print("\t--cycles=N\tstop after N instructions (default: run until the end loop)")
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:] if arg.startswith('--'))
+    if len(args) != 1 or not Path(args[0]).exists():
+        printUsage()
+        sys.exit()
+    if 'cycles' in options and not options['cycles'].isdigit():
+        printUsage()
+        print('Invalid cycles:', options['cycles'], '\nAborting!')
+        sys.exit(1)
+    try:
+        emulator = Emulator(*loadProgram(args[0]))
+    except ValueError as error:
+        print('Error:', error)
+        sys.exit(1)
+    maxCycles = int(options['cycles']) if 'cycles' in options else None
+    cycles = emulator.run(maxCycles)
+    print('instructions executed:', cycles)
+    print('halted:', emulator.halted())
+    stack = [emulator.signed(address) for address in range(256, emulator.ram[0])]
+    print('SP:', emulator.ram[0], 'stack:', stack[-10:])
+
+if __name__ == "__main__":
+    main()
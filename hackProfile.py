@@ -0,0 +1,97 @@
+import sys
+import json
+from pathlib import Path
+import hackEmulator
+
+def loadSourceMap(fname):
+    '''loadSourceMap(str) -> list
+
+    Returns the origins in the source map at fname, written by the VM
+    translator with --map, as a list indexed by ROM address of
+    (vm file, line, function, command) tuples.
+    '''
+    origins = []
+    with open(fname) as mapFile:
+        for entry in mapFile:
+            address, vmfile, line, function, command = entry.rstrip('\n').split('\t')
+            origins.append((vmfile, int(line), function, command))
+    return origins
+
+def attribute(histogram, origins):
+    '''attribute(dict, list) -> tuple
+
+    Groups a histogram that maps ROM addresses to the number of times
+    they were executed by the origins of the instructions. Returns a
+    tuple of two dictionaries: instructions executed per function and
+    per vm command, the latter keyed on (vm file, line, function,
+    command).
+    '''
+    functions = {}
+    commands = {}
+    for address, count in histogram.items():
+        origin = origins[address] if address < len(origins) else ('', 0, '$$UNKNOWN', '')
+        functions[origin[2]] = functions.get(origin[2], 0) + count
+        commands[origin] = commands.get(origin, 0) + count
+    return functions, commands
+
+def printProfile(functions, commands, top):
+    '''printProfile(dict, dict, int) -> None
+
+    Prints the top functions and vm commands by instructions executed,
+    as returned by attribute().
+    '''
+    total = sum(functions.values())
+    print('{:>12}{:>8}  {}'.format('instructions', '%', 'function'))
+    for function, count in sorted(functions.items(), key=lambda item: -item[1])[:top]:
+        print('{:>12}{:>8.1f}  {}'.format(count, 100 * count / total, function))
+    print()
+    print('{:>12}{:>8}  {}'.format('instructions', '%', 'command'))
+    for origin, count in sorted(commands.items(), key=lambda item: -item[1])[:top]:
+        vmfile, line, function, command = origin
+        source = '{}:{}'.format(Path(vmfile).name, line) if vmfile else function
+        print('{:>12}{:>8.1f}  {} {} ({})'.format(count, 100 * count / total, source, command, function))
+    print()
+    print('total instructions executed:', total)
+
+def printUsage():
+    '''printUsage() -> None
+
+    Prints information on how to call this file.
+    '''
+    print("Usage: hackProfile [options] program")
+    print("program is a .asm file translated with --map, next to its .map file")
+    print("options are")
+    print("\t--histogram=FILE\tread the instructions executed per ROM address from")
+    print("\t\t\t\ta JSON object in FILE instead of running the program")
+    print("\t--cycles=N\tstop after N instructions (default: run until the end loop)")
+    print("\t--top=N\t\tlist the N most expensive functions and commands (default 20)")
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:] if arg.startswith('--'))
+    if len(args) != 1 or not Path(args[0]).with_suffix('.map').exists():
+        printUsage()
+        sys.exit()
+    #A bare --name has an empty value
+    for name in ['cycles', 'top', 'histogram']:
+        if name in options and not (options[name] if name == 'histogram' else options[name].isdigit()):
+            printUsage()
+            print('Invalid {}:'.format(name), options[name], '\nAborting!')
+            sys.exit(1)
+    origins = loadSourceMap(str(Path(args[0]).with_suffix('.map')))
+    if 'histogram' in options:
+        with open(options['histogram']) as histogramFile:
+            histogram = {int(address): count for address, count in json.load(histogramFile).items()}
+    else:
+        try:
+            emulator = hackEmulator.Emulator(*hackEmulator.loadProgram(args[0]))
+        except ValueError as error:
+            print('Error:', error)
+            sys.exit(1)
+        maxCycles = int(options['cycles']) if 'cycles' in options else None
+        emulator.run(maxCycles, profile=True)
+        histogram = emulator.histogram()
+    printProfile(*attribute(histogram, origins), int(options.get('top', 20)))
+
+if __name__ == "__main__":
+    main()
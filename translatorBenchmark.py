@@ -0,0 +1,192 @@
+import sys
+import io
+import json
+import time
+import random
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+from pathlib import Path
+import vmTranslator
+
+#Number of commands in each generated program, by default. The output is
+#spooled to disk, so the largest is limited by time rather than memory.
+SIZES = [10000, 100000, 1000000, 10000000]
+
+#Commands per generated class, so that bigger programs have more files
+CLASS_SIZE = 5000
+
+#Largest drop in commands per second, in percent, allowed by --baseline
+THRESHOLD = 10
+
+SEGMENTS = ['local', 'local', 'local', 'argument', 'argument', 'this', 'that', 'static']
+
+def _expression(rng, commands):
+    '''Adds the commands of a random expression, as the Jack compiler
+    writes them, leaving one value on the stack.'''
+    if rng.random() < 0.4:
+        commands.append('push constant ' + str(rng.randrange(100)))
+    else:
+        commands.append('push {} {}'.format(rng.choice(SEGMENTS), rng.randrange(4)))
+    for i in range(rng.choice([0, 0, 1, 1, 2, 3])):
+        commands.append('push {} {}'.format(rng.choice(SEGMENTS + ['constant']), rng.randrange(4)))
+        commands.append(rng.choice(['add', 'add', 'add', 'sub', 'sub', 'lt', 'gt', 'eq', 'and', 'or']))
+    if rng.random() < 0.1:
+        commands.append(rng.choice(['not', 'neg']))
+
+def _statement(rng, commands, className, functions, labels):
+    '''Adds the commands of a random let, if, while, do or array
+    statement to commands.'''
+    kind = rng.random()
+    if kind < 0.4:
+        _expression(rng, commands)
+        commands.append('pop {} {}'.format(rng.choice(SEGMENTS), rng.randrange(4)))
+    elif kind < 0.55:
+        label = 'IF' + str(labels)
+        _expression(rng, commands)
+        commands.extend(['if-goto {}_TRUE'.format(label), 'goto {}_FALSE'.format(label),
+                         'label {}_TRUE'.format(label)])
+        _expression(rng, commands)
+        commands.extend(['pop local 0', 'label {}_FALSE'.format(label)])
+    elif kind < 0.65:
+        label = 'WHILE' + str(labels)
+        commands.append('label {}_EXP'.format(label))
+        _expression(rng, commands)
+        commands.extend(['not', 'if-goto {}_END'.format(label)])
+        _expression(rng, commands)
+        commands.extend(['pop local 1', 'goto {}_EXP'.format(label), 'label {}_END'.format(label)])
+    elif kind < 0.85:
+        numArgs = rng.randrange(4)
+        for i in range(numArgs):
+            _expression(rng, commands)
+        commands.append('call {}.f{} {}'.format(className, rng.randrange(functions), numArgs))
+        commands.append('pop temp 0')
+    else:
+        commands.extend(['push local 2', 'push local 0', 'add', 'pop pointer 1'])
+        _expression(rng, commands)
+        commands.append('pop that 0')
+
+def generateCorpus(directory, size, seed=0):
+    '''generateCorpus(str, int, int) -> int
+
+    Writes a synthetic program of about size commands to the directory,
+    as one vm file per class of CLASS_SIZE commands, with a mix of
+    commands like that of compiled Jack code. Returns the number of
+    commands written.
+    '''
+    rng = random.Random(seed)
+    total = 0
+    classes = max(1, size // CLASS_SIZE)
+    for number in range(classes):
+        className = 'Class' + str(number)
+        functions = max(1, CLASS_SIZE // 100)
+        commands = []
+        labels = 0
+        for function in range(functions):
+            commands.append('function {}.f{} {}'.format(className, function, rng.randrange(5)))
+            end = len(commands) + min(size, CLASS_SIZE) // functions - 3
+            while len(commands) < end:
+                _statement(rng, commands, className, functions, labels)
+                labels = labels + 1
+            commands.extend(['push constant 0', 'return'])
+        with open(Path(directory) / (className + '.vm'), 'w') as vmFile:
+            vmFile.write('\n'.join(commands) + '\n')
+        total = total + len(commands)
+    with open(Path(directory) / 'Sys.vm', 'w') as vmFile:
+        vmFile.write('function Sys.init 0\ncall Class0.f0 0\npop temp 0\nlabel END\ngoto END\n')
+    return total + 5
+
+def measure(directory, options):
+    '''measure(str, dict) -> dict
+
+    Translates the program in directory in this process and returns
+    the seconds it took, the peak memory of the process in bytes and
+    the size of the output in bytes. Run in a fresh process, so that
+    the peak memory is that of one translation.
+    '''
+    vmFiles = vmTranslator.listVmFiles(Path(directory))
+    asmFname = directory + '.asm'
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        vmTranslator.translateProgram(asmFname, vmFiles, options)
+    seconds = time.perf_counter() - start
+    #ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    output = Path(asmFname[:-4] + '.' + options.get('format', 'asm'))
+    return {'seconds': seconds, 'peakMemory': peak, 'outputBytes': output.stat().st_size}
+
+def compare(results, baseline, threshold):
+    '''compare(dict, dict, float) -> list
+
+    Returns a list of messages, one for each size whose commands per
+    second dropped by more than threshold percent from the baseline.
+    '''
+    regressions = []
+    for size, result in results.items():
+        if size not in baseline:
+            continue
+        before = baseline[size]['commandsPerSecond']
+        after = result['commandsPerSecond']
+        if after < before * (1 - threshold / 100):
+            regressions.append('{} commands: {:.0f} commands/s is {:.1f}% below {:.0f}'.format(
+                size, after, 100 * (before - after) / before, before))
+    return regressions
+
+def printUsage():
+    '''printUsage() -> None
+
+    Prints information on how to call this file.
+    '''
+    print("Usage: translatorBenchmark [options]")
+    print("Generates vm programs of several sizes and times their translation")
+    print("options are")
+    print("\t--sizes=N,N,...\tnumber of commands of each program (default 10000,100000,1000000,10000000)")
+    print("\t--baseline=FILE\tfail if commands per second dropped from those in FILE")
+    print("\t--threshold=PCT\tlargest drop allowed by --baseline, in percent (default 10)")
+    print("\t--save=FILE\twrite the results to FILE, for use as a baseline")
+    print("\tany other option is passed on to the translator, e.g. --optimize")
+
+def main():
+    options = vmTranslator.getOptions()
+    if 'help' in options:
+        printUsage()
+        sys.exit()
+    sizes = SIZES
+    if 'sizes' in options:
+        sizes = [int(size) for size in options.pop('sizes').split(',')]
+    baselineFname = options.pop('baseline', None)
+    saveFname = options.pop('save', None)
+    threshold = float(options.pop('threshold', THRESHOLD))
+    results = {}
+    print('{:>10}{:>10}{:>14}{:>12}{:>14}'.format('commands', 'seconds', 'commands/s',
+                                                 'peak MB', 'output bytes'))
+    #Every measurement gets a new process, which starts with no memory
+    #in use by earlier translations
+    context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            program = str(Path(directory) / 'Program')
+            Path(program).mkdir()
+            commands = generateCorpus(program, size)
+            with context.Pool(1) as pool:
+                result = pool.apply(measure, (program, options))
+        result['commands'] = commands
+        result['commandsPerSecond'] = commands / result['seconds']
+        results[str(size)] = result
+        print('{:>10}{:>10.2f}{:>14.0f}{:>12.1f}{:>14}'.format(commands, result['seconds'],
+              result['commandsPerSecond'], result['peakMemory'] / 2 ** 20, result['outputBytes']))
+    if saveFname:
+        with open(saveFname, 'w') as saveFile:
+            json.dump(results, saveFile, indent=2, sort_keys=True)
+    if baselineFname:
+        with open(baselineFname) as baselineFile:
+            regressions = compare(results, json.load(baselineFile), threshold)
+        for message in regressions:
+            print('Regression:', message)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,287 +1,2221 @@
 import sys
+import os
+import struct
+import time
+import re
+import mmap
+import json
+import shutil
+import hashlib
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 #HAMMAD SIDDIQUI
 class Parser(object):
-    '''Parses a single vm file to provide convenient access to the
-    contained commands and their components.
-    '''
-     
-    def __init__(self, fname):
-        '''Opens the input file at fname and get ready to parse it.
-        '''
-        self.vmFile = open(fname, 'r')
-        self.data = self.vmFile.readline()
-     
-    def __str__(self):
-        '''Leave as is.'''
-        return 'Parser object'
- 
-    def hasMoreCommands(self):
-        '''P.hasMoreCommands() -> bool
- 
-        Returns True if there are commands in the input, False
-        otherwise.
-        '''
-        if self.data == '' or self.data == None:
-            self.vmFile.close()
-            return False
-        else:
-            return True
- 
-    def advance(self):
-        '''P.advance() -> None
- 
-        Makes the next command the current command. Should be called
-        only if hasMoreCommands() is True.
-        '''
-        if self.hasMoreCommands() == True:
-            self.data = self.vmFile.readline()
- 
-    def commandType(self):
-        '''P.commandType() -> str
- 
-        Returns the type of the current VM command: one of
-        C_ARITHMETIC
-        C_PUSH, C_POP
-        C_LABEL
-        C_GOTO
-        C_IF
-        C_FUNCTION
-        C_RETURN
-        C_CALL
-        '''
-        if self.data.find('push') == 0:
-            return 'C_PUSH'
-        elif self.data.find('pop') == 0:
-            return 'C_POP'
-        elif self.data.find('label') == 0:
-            return 'C_LABEL'
-        elif self.data.find('goto') == 0:
-            return 'C_GOTO'
-        elif self.data.find('if-goto') == 0:
-            return 'C_IF'
-        elif self.data.find('function') == 0:
-            return 'C_Function'
-        elif self.data.find('call') == 0:
-            return "C_CALL"
-        elif self.data.find('return') == 0:
-            return 'C_RETURN'
-        else:
-            return 'C_ARITHMETIC'
- 
-     
-    def arg1(self):
-        '''P.arg1() -> string
- 
-        Returns the first argument of the current command. In the case
-        of C_ARTIHMETIC, the command itself (e.g. sub, add) is
-        returned. Should not be called if the current command is
-        C_RETURN.
-        '''
-        commandTypes = ['C_PUSH', 'C_POP',
-        'C_LABEL',
-        'C_GOTO',
-        'C_IF',
-        'C_FUNCTION',
-        'C_CALL']
-         
-        if self.commandType() == 'C_ARITHMETIC':
-            return self.data
-        elif self.commandType() in commandTypes:
-            return self.data.split()[1]
- 
-    def arg2(self):
-        '''P.arg2() -> int
- 
-        Returns the second argument of the current command. Should be
-        called only if the current command is any of
-        C_PUSH
-        C_POP
-        C_FUNCTION
-        C_CALL
-        '''
-        commandTypes = ['C_PUSH',
-        'C_POP',
-        'C_FUNCTION',
-        'C_CALL']
-        if self.commandType() in commandTypes:
-            return int(self.data.split()[2])
-     
+    '''Parses a single vm file to provide convenient access to the
+    contained commands and their components.
+    '''
+
+    def __init__(self, fname):
+        '''Opens the input file at fname and get ready to parse it.
+        '''
+        self.vmFile = open(fname, 'r')
+        self.data = self.vmFile.readline()
+
+    def __str__(self):
+        '''Leave as is.'''
+        return 'Parser object'
+
+    def hasMoreCommands(self):
+        '''P.hasMoreCommands() -> bool
+
+        Returns True if there are commands in the input, False
+        otherwise.
+        '''
+        if self.data == '' or self.data == None:
+            self.vmFile.close()
+            return False
+        else:
+            return True
+
+    def advance(self):
+        '''P.advance() -> None
+
+        Makes the next command the current command. Should be called
+        only if hasMoreCommands() is True.
+        '''
+        if self.hasMoreCommands() == True:
+            self.data = self.vmFile.readline()
+
+    def commandType(self):
+        '''P.commandType() -> str
+
+        Returns the type of the current VM command: one of
+        C_ARITHMETIC
+        C_PUSH, C_POP
+        C_LABEL
+        C_GOTO
+        C_IF
+        C_FUNCTION
+        C_RETURN
+        C_CALL
+        '''
+        if self.data.find('push') == 0:
+            return 'C_PUSH'
+        elif self.data.find('pop') == 0:
+            return 'C_POP'
+        elif self.data.find('label') == 0:
+            return 'C_LABEL'
+        elif self.data.find('goto') == 0:
+            return 'C_GOTO'
+        elif self.data.find('if-goto') == 0:
+            return 'C_IF'
+        elif self.data.find('function') == 0:
+            return 'C_FUNCTION'
+        elif self.data.find('call') == 0:
+            return "C_CALL"
+        elif self.data.find('return') == 0:
+            return 'C_RETURN'
+        else:
+            return 'C_ARITHMETIC'
+
+
+    def arg1(self):
+        '''P.arg1() -> string
+
+        Returns the first argument of the current command. In the case
+        of C_ARTIHMETIC, the command itself (e.g. sub, add) is
+        returned. Should not be called if the current command is
+        C_RETURN.
+        '''
+        commandTypes = ['C_PUSH', 'C_POP',
+        'C_LABEL',
+        'C_GOTO',
+        'C_IF',
+        'C_FUNCTION',
+        'C_CALL']
+
+        if self.commandType() == 'C_ARITHMETIC':
+            return self.data
+        elif self.commandType() in commandTypes:
+            return self.data.split()[1]
+
+    def arg2(self):
+        '''P.arg2() -> int
+
+        Returns the second argument of the current command. Should be
+        called only if the current command is any of
+        C_PUSH
+        C_POP
+        C_FUNCTION
+        C_CALL
+        '''
+        commandTypes = ['C_PUSH',
+        'C_POP',
+        'C_FUNCTION',
+        'C_CALL']
+        if self.commandType() in commandTypes:
+            return int(self.data.split()[2])
+
+class Lexer(object):
+    '''Splits a whole vm file into commands in a single pass over a
+    memory map of the file. Iterating over a Lexer yields one
+    (command type, arg1, arg2, line number) record per command, with
+    arg1 and arg2 as Parser.arg1() and Parser.arg2() return them.
+    '''
+
+    #Matches every line: up to three words, then the rest of the line,
+    #which must be empty or a comment. Comment and empty lines have no
+    #first word.
+    LINE = re.compile(rb'[ \t]*([^\s/]*)[ \t]*([^\s/]*)[ \t]*([^\s/]*)[^\S\n]*([^\n]*)\n?')
+
+    #Maps the first word of every command to its type and the word
+    #itself as a string.
+    KEYWORDS = {b'push': ('C_PUSH', 'push'),
+                b'pop': ('C_POP', 'pop'),
+                b'label': ('C_LABEL', 'label'),
+                b'goto': ('C_GOTO', 'goto'),
+                b'if-goto': ('C_IF', 'if-goto'),
+                b'function': ('C_FUNCTION', 'function'),
+                b'call': ('C_CALL', 'call'),
+                b'return': ('C_RETURN', 'return'),
+                b'add': ('C_ARITHMETIC', 'add'),
+                b'sub': ('C_ARITHMETIC', 'sub'),
+                b'neg': ('C_ARITHMETIC', 'neg'),
+                b'eq': ('C_ARITHMETIC', 'eq'),
+                b'gt': ('C_ARITHMETIC', 'gt'),
+                b'lt': ('C_ARITHMETIC', 'lt'),
+                b'and': ('C_ARITHMETIC', 'and'),
+                b'or': ('C_ARITHMETIC', 'or'),
+                b'not': ('C_ARITHMETIC', 'not')}
+
+    SEGMENTS = {segment.encode(): segment for segment in
+                ['argument', 'local', 'static', 'constant', 'this', 'that', 'pointer', 'temp']}
+
+    def __init__(self, fname):
+        '''Gets ready to lex the vm file at fname.'''
+        self.fname = fname
+
+    def __str__(self):
+        return 'Lexer object.'
+
+    def __iter__(self):
+        '''Yields the record of each command in the file, in order. The
+        file is read by code(), so that records and CommandArrays always
+        accept the same commands.'''
+        return iter(self.code())
+
+    def code(self):
+        '''L.code() -> CommandArray
+
+        Returns all the commands in the file as a CommandArray, filled
+        straight from the matches rather than from their records. Raises
+        ValueError, with the file and line, on an invalid command.
+        '''
+        code = CommandArray()
+        if os.path.getsize(self.fname) == 0:
+            return code #Empty files cannot be memory mapped
+        keywords = CommandArray.KEYWORDS
+        accesses = CommandArray.ACCESSES
+        intern = code.intern
+        columns = ([], [], [], [], [])
+        opcodes, segments, indexes, names, lines = columns
+        with open(self.fname, 'rb') as vmFile:
+            with mmap.mmap(vmFile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for line, match in enumerate(self.LINE.finditer(data), 1):
+                    keyword, arg1, arg2, rest = match.groups()
+                    try:
+                        #Anything but a comment after the arguments
+                        if rest and not rest.startswith(b'//'):
+                            raise ValueError
+                        if not keyword:
+                            continue
+                        opcode = keywords[keyword]
+                        segment = name = index = 0
+                        if opcode <= CommandArray.POP:
+                            #Unknown segments and pop constant are missing
+                            segment = accesses[keyword, arg1]
+                            if not arg2.isdigit():
+                                raise ValueError
+                            index = int(arg2)
+                            #Larger numbers do not fit an A-instruction
+                            if index > 32767:
+                                raise ValueError
+                        elif opcode < CommandArray.RETURN:
+                            #Labels take no second argument
+                            if not arg1 or (opcode < CommandArray.FUNCTION and arg2):
+                                raise ValueError
+                            name = intern(arg1.decode())
+                            if opcode >= CommandArray.FUNCTION:
+                                index = int(arg2)
+                        elif arg1:
+                            raise ValueError
+                    except (KeyError, ValueError):
+                        raise ValueError('{}:{}: invalid command {}'.format(
+                            self.fname, line, match.group().decode().strip())) from None
+                    opcodes.append(opcode)
+                    segments.append(segment)
+                    indexes.append(index)
+                    names.append(name)
+                    lines.append(line)
+        for column, values in zip([code.opcodes, code.segments, code.indexes, code.names, code.lines],
+                                  columns):
+            column.extend(values)
+        return code
+
+#The keyword of every command type but C_ARITHMETIC
+COMMANDS = {command: name for command, name in Lexer.KEYWORDS.values()
+            if command != 'C_ARITHMETIC'}
+
+def cheapest(strategies):
+    '''cheapest(list) -> tuple
+
+    Returns the (name, instructions) pair of the cheapest sequence in
+    strategies, the first of them on a tie. Every Hack instruction
+    takes one cycle and one word of ROM, so a sequence costs as much as
+    it has instructions.
+    '''
+    return min(strategies, key=lambda strategy: len(strategy[1]))
+
 class CodeWriter(object):
-    '''Translates VM commands into Hack assembly code.'''
-     
-    def __init__(self, fname):
-        '''Opens the output file at fname and gets ready to write to it.'''
-        self.output = open(fname, 'w')
-        self.output.write("@256\nD=A\n@SP\nM=D\n")
-        self._count = 0
-     
-    def __str__(self):
-        '''Leave as is.'''
-        return 'CodeWriter object.'
- 
-    def setFileName(self, fname):
-        '''CW.setFileName(str) -> None
- 
-        Informs the code writer that the translation of the VM file at
-        fname is to be started.
-        '''
-        self.name = fname
-     
-    def writeArithmetic(self, command):
-        '''CW.writeArithmetic(str) -> None
- 
-        Writes to the output file the assmebly code that is the
-        translation of the given arithmetic command.
-        '''
-        #self.data of Class Parser = command
-        self.output.write("\n@SP\nA=M-1\n")
-        if command == 'neg':
-            self.output.write('M=-M\n')
-        elif command == 'not':
-            self.output.write('M=!M\n')
-        else:
-            self.output.write("\nD=M\n@SP\nAM=M-1\nM=0\nA=A-1\n")
-            #if command == 'add' Doesn't works, Strange
-            if 'add' in command:
-                self.output.write("M=M+D\n")
-            elif 'sub' in command:
-                self.output.write("M=M-D\n")
-            elif 'or' in command:
-                self.output.write("M=M|D\n")
-            elif 'and' in command:
-                self.output.write("M=M&D\n")
-            else:
-                self.output.write("D=M-D\n@TRUE" + str(self._count) + "\nD;J")
-                if command == 'eq':
-                    self.output.write("EQ")
-                elif command == 'lt':
-                    self.output.write("LT")
-                elif command == 'gt':
-                    self.output.write("GT")
-                self.output.write("\n@SP\nA=M-1\nM=0\n@FALSE" + str(self._count) + "\n0;JEQ\n(TRUE" + str(self._count) + ")\n@SP\nA=M-1\nM=-1\n" + "(FALSE" + str(self._count) + ")\n")
-                self._count = self._count + 1
- 
-    def writePushPop(self, command, segment, index):
-        '''CW.writePushPop(str) -> None
- 
-        Writes to the output file the assmebly code that is the
-        translation of the given command, where command is either
-        C_PUSH or C_POP.
-        '''
-        if segment == 'local':
-            self.output.write("@LCL\nD=M")
-        elif segment == 'argument':
-            self.output.write("@ARG\nD=M")
-        elif segment == 'that':
-            self.output.write("@THAT\nD=M")
-        elif segment == 'this':
-            self.output.write("@THIS\nD=M")
-        elif segment == 'temp':
-            self.output.write("@5\nD=A")
-        elif segment == 'pointer':
-            self.output.write("@3\nD=A")
-        elif segment == 'static':
-            self.output.write("@" + self.name + "." + str(index) + "\nD=A")
-        elif segment == 'constant':
-            if index == 0 or index == 1:
-                self.output.write("\nD=" + str(index))
-            else:
-                self.output.write("@" + str(index) + "\nD=A")
-        if segment != 'static' and segment != 'constant' and index != 0:
-            self.output.write("\n@" + str(index) + "\nD=D+A")
-        if command == 'C_PUSH':
-            if segment == "constant":
-                self.output.write("\n@SP\nAM=M+1\nA=A-1\nM=D\n")
-            else:
-                self.output.write("\nA=D\nD=M\n@SP\nAM=M+1\nA=A-1\nM=D\n")
-        else:
-            self.output.write("\n@R13\nM=D\n@SP\nAM=M-1\nD=M\nM=0\n@R13\nA=M\nM=D\n")
- 
- 
-    def close(self):
-        '''CW.close() -> None
- 
-        Close the output file.
-        '''
-        self.output.write("(INFINITE_LOOP)\n@INFINITE_LOOP\n0;JEQ\n")
-        self.output.close()
- 
+    '''Translates VM commands into Hack assembly code.'''
+
+    #Base pointers of the segments that are addressed through them
+    POINTERS = {'local': 'LCL', 'argument': 'ARG', 'this': 'THIS', 'that': 'THAT'}
+
+    #Instruction of each binary arithmetic command but the comparisons,
+    #with the second operand in D and the first in M
+    BINARY = {'add': "M=M+D\n", 'sub': "M=M-D\n", 'and': "M=M&D\n", 'or': "M=M|D\n"}
+
+    def __init__(self, fname, optimize=False, compare='inline', sourceMap=False, format='asm',
+                 staticFrames=None):
+        '''Gets ready to write to the output file at fname, which close()
+        opens and writes. The generated instructions are buffered until
+        close(), where they are run through the Peephole optimizer if
+        optimize is True. When nothing needs the whole output at once
+        (no optimizer, source map or assembler) they are spooled to a
+        temporary file instead, so that memory use does not grow with
+        the program.
+        compare is either 'inline', to expand every eq, gt and lt in
+        place, or 'shared', to call one comparison routine per operator.
+        If sourceMap is True, the origin of every instruction is kept
+        and close() writes it to a .map file next to the output file.
+        format is 'asm' to write assembly, or 'hack' or 'bin' to
+        assemble it and write machine code as text or as big-endian
+        16-bit words. staticFrames maps the functions whose frame is at
+        fixed addresses to the pointer entries they save, as returned by
+        allocateStaticFrames(). If fname is None the writer only collects
+        a fragment (see fragment()) and must not be closed.
+        '''
+        self.fname = fname
+        self.staticFrames = staticFrames or {}
+        self.format = format
+        self.output = None
+        self._spool = None
+        if fname is not None and not optimize and not sourceMap and format == 'asm':
+            self._spool = tempfile.TemporaryFile('w+')
+        self.optimize = optimize
+        self.compare = compare
+        self.instructions = []
+        #The (vm file, line, function, command) each instruction came from
+        self.origins = [] if sourceMap else None
+        self._origin = None
+        self._routines = set()
+        self._functions = set()
+        self._function = ''
+        self._prefix = ''
+        self._count = 0
+
+    def __str__(self):
+        '''Leave as is.'''
+        return 'CodeWriter object.'
+
+    def setFileName(self, fname):
+        '''CW.setFileName(str) -> None
+
+        Informs the code writer that the translation of the VM file at
+        fname is to be started.
+        '''
+        self.name = fname
+        #Static variables are named after the file, without its directory
+        self._static = Path(fname).name
+        #Labels outside of any function are scoped to the file
+        self._function = Path(fname).stem
+        #Generated labels are numbered per file, so that files can be
+        #translated separately and still get unique labels
+        self._prefix = Path(fname).stem + "$$"
+        self._count = 0
+
+    def setOrigin(self, line, command, arg1=None, arg2=None):
+        '''CW.setOrigin(int, str, str, int) -> None
+
+        Informs the code writer that the following instructions are the
+        translation of the given command, found at line of the current
+        file. Only needed for the source map.
+        '''
+        function = arg1 if command == 'C_FUNCTION' else self._function
+        self._origin = (self.name, line, function, formatCommand(command, arg1, arg2))
+
+    def fragment(self):
+        '''CW.fragment() -> tuple
+
+        Returns the code written so far as a fragment: a tuple of the
+        instructions, the shared routines they use, the functions they
+        define and the origins of the instructions (None without a
+        source map). Fragments can be pickled and added to another
+        CodeWriter with writeFragment().
+        '''
+        return (self.instructions, sorted(self._routines), sorted(self._functions), self.origins)
+
+    def writeFragment(self, fragment):
+        '''CW.writeFragment(tuple) -> None
+
+        Adds a fragment returned by fragment() to the output.
+        '''
+        instructions, routines, functions, origins = fragment
+        if self._spool is not None:
+            if instructions:
+                self._spool.write('\n'.join(instructions) + '\n')
+        else:
+            self.instructions.extend(instructions)
+        self._routines.update(routines)
+        self._functions.update(functions)
+        if self.origins is not None:
+            self.origins.extend(tuple(origin) for origin in origins)
+
+    def _write(self, text):
+        '''CW._write(str) -> None
+
+        Adds the instructions in text, one per line, to the buffered or
+        spooled output. Empty lines are dropped.
+        '''
+        lines = [line for line in text.split('\n') if line]
+        if self._spool is not None:
+            if lines:
+                self._spool.write('\n'.join(lines) + '\n')
+            return
+        self.instructions.extend(lines)
+        if self.origins is not None:
+            self.origins.extend([self._origin] * len(lines))
+
+    def writeCommand(self, command, arg1=None, arg2=None):
+        '''CW.writeCommand(str, str, int) -> None
+
+        Writes the translation of a command given as its type and
+        arguments, as produced by a Lexer.
+        '''
+        if command == 'C_ARITHMETIC':
+            self.writeArithmetic(arg1)
+        elif command == 'C_PUSH' or command == 'C_POP':
+            self.writePushPop(command, arg1, arg2)
+        elif command == 'C_LABEL':
+            self.writeLabel(arg1)
+        elif command == 'C_GOTO':
+            self.writeGoto(arg1)
+        elif command == 'C_IF':
+            self.writeIf(arg1, arg2)
+        elif command == 'C_FUNCTION':
+            self.writeFunction(arg1, arg2)
+        elif command == 'C_CALL':
+            self.writeCall(arg1, arg2)
+        elif command == 'C_RETURN':
+            self.writeReturn()
+
+    def writeCode(self, code):
+        '''CW.writeCode(CommandArray) -> None
+
+        Writes the translation of every command in code, dispatching on
+        the opcodes rather than on the command type strings. Sets the
+        origin of each command when there is a source map.
+        '''
+        opcodes = CommandArray.OPCODES
+        segments = CommandArray.SEGMENTS
+        strings = code.strings
+        sourceMap = self.origins is not None
+        for position, (opcode, segment, index, name) in enumerate(
+                zip(code.opcodes, code.segments, code.indexes, code.names)):
+            if sourceMap:
+                command, arg1, arg2, line = code[position]
+                self.setOrigin(line, command, arg1, arg2)
+            if opcode <= CommandArray.POP:
+                self.writePushPop(opcodes[opcode][0], segments[segment], index)
+            elif opcode >= CommandArray.ARITHMETIC:
+                self.writeArithmetic(opcodes[opcode][1])
+            elif opcode == CommandArray.LABEL:
+                self.writeLabel(strings[name])
+            elif opcode == CommandArray.GOTO:
+                self.writeGoto(strings[name])
+            elif opcode == CommandArray.IF:
+                self.writeIf(strings[name], CommandArray.JUMPS[index] or None)
+            elif opcode == CommandArray.FUNCTION:
+                self.writeFunction(strings[name], index)
+            elif opcode == CommandArray.CALL:
+                self.writeCall(strings[name], index)
+            else:
+                self.writeReturn()
+
+    def writeArithmetic(self, command):
+        '''CW.writeArithmetic(str) -> None
+
+        Writes to the output file the assembly code that is the
+        translation of the given arithmetic command.
+        '''
+        if self.compare == 'shared' and command in ['eq', 'gt', 'lt']:
+            self._writeSharedCompare(command)
+            return
+        self._write("\n@SP\nA=M-1\n")
+        if command == 'neg':
+            self._write('M=-M\n')
+        elif command == 'not':
+            self._write('M=!M\n')
+        else:
+            self._write("\nD=M\n@SP\nAM=M-1\nM=0\nA=A-1\n")
+            if command in self.BINARY:
+                self._write(self.BINARY[command])
+            else:
+                jump = command.upper()
+                true = self._prefix + "TRUE" + str(self._count)
+                false = self._prefix + "FALSE" + str(self._count)
+                self._write("D=M-D\n@" + true + "\nD;J" + jump)
+                self._write("\n@SP\nA=M-1\nM=0\n@" + false + "\n0;JEQ\n(" + true + ")\n@SP\nA=M-1\nM=-1\n" + "(" + false + ")\n")
+                self._count = self._count + 1
+
+    def _writeSharedCompare(self, command):
+        '''CW._writeSharedCompare(str) -> None
+
+        Writes a call to the shared routine for the comparison command,
+        passing the return address in D. The routine itself is written
+        once by close().
+        '''
+        label = self._prefix + "CMP_RETURN" + str(self._count)
+        self._write("@" + label + "\nD=A\n@$$" + command.upper() + "\n0;JMP\n(" + label + ")\n")
+        self._routines.add(command)
+        self._count = self._count + 1
+
+    def _writeCompareRoutine(self, command):
+        '''CW._writeCompareRoutine(str) -> None
+
+        Writes the shared routine for the comparison command. It pops
+        two values, pushes -1 (true) or 0 (false) and jumps back to the
+        return address that was passed in D.
+        '''
+        name = "$$" + command.upper()
+        self._write("(" + name + ")\n@R13\nM=D\n@SP\nAM=M-1\nD=M\nA=A-1\nD=M-D\n")
+        self._write("@" + name + "_TRUE\nD;J" + command.upper() + "\nD=0\n@" + name + "_END\n0;JMP\n")
+        self._write("(" + name + "_TRUE)\nD=-1\n(" + name + "_END)\n")
+        self._write("@SP\nA=M-1\nM=D\n@R13\nA=M\n0;JMP\n")
+
+    def writeLabel(self, label):
+        '''CW.writeLabel(str) -> None
+
+        Writes the assembly code that is the translation of the given
+        label command. Labels are scoped to the current function.
+        '''
+        self._write("(" + self._function + "$" + label + ")\n")
+
+    def writeGoto(self, label):
+        '''CW.writeGoto(str) -> None
+
+        Writes the assembly code that is the translation of the given
+        goto command.
+        '''
+        self._write("@" + self._function + "$" + label + "\n0;JMP\n")
+
+    def writeIf(self, label, jump=None):
+        '''CW.writeIf(str, str) -> None
+
+        Writes the assembly code that is the translation of the given
+        if-goto command. If jump is given, the command was fused with
+        the comparison before it by fuseBranches(): the two operands
+        are popped and the jump is taken on their difference.
+        '''
+        if jump is None:
+            self._write("@SP\nAM=M-1\nD=M\n@" + self._function + "$" + label + "\nD;JNE\n")
+        else:
+            self._write("@SP\nAM=M-1\nD=M\nA=A-1\nD=M-D\n@SP\nM=M-1\n")
+            self._write("@" + self._function + "$" + label + "\nD;" + jump + "\n")
+
+    def writeFunction(self, functionName, numLocals):
+        '''CW.writeFunction(str, int) -> None
+
+        Writes the assembly code that is the translation of the given
+        function command, pushing numLocals zeros for its locals.
+        '''
+        self._function = functionName
+        self._functions.add(functionName)
+        self._write("(" + functionName + ")\n")
+        if functionName in self.staticFrames:
+            #The caller passes the return address in D
+            self._write("@" + functionName + "$$return\nM=D\n")
+            for i in range(numLocals):
+                self._write("@" + functionName + "$$local." + str(i) + "\nM=0\n")
+            for index in self.staticFrames[functionName]:
+                self._write("@" + str(3 + index) + "\nD=M\n@" + functionName + "$$pointer." + str(index) + "\nM=D\n")
+        elif numLocals < 3:
+            self._write("@SP\nAM=M+1\nA=A-1\nM=0\n" * numLocals)
+        else:
+            self._write("@SP\nA=M\n" + "M=0\nA=A+1\n" * numLocals + "D=A\n@SP\nM=D\n")
+
+    def writeCall(self, functionName, numArgs):
+        '''CW.writeCall(str, int) -> None
+
+        Writes the assembly code that is the translation of the given
+        call command. The frame is saved by the shared call routine,
+        which gets the callee in R13, numArgs in R14 and the return
+        address in D.
+        '''
+        label = self._function + "$ret." + str(self._count)
+        self._count = self._count + 1
+        if functionName in self.staticFrames:
+            #The arguments go straight into the callee's frame, and the
+            #return value ends up where the first of them was
+            for i in reversed(range(numArgs)):
+                self._write("@SP\nAM=M-1\nD=M\n@" + functionName + "$$arg." + str(i) + "\nM=D\n")
+            self._write("@" + label + "\nD=A\n@" + functionName + "\n0;JMP\n(" + label + ")\n")
+            return
+        self._write("@" + functionName + "\nD=A\n@R13\nM=D\n")
+        self._write("@" + str(numArgs) + "\nD=A\n@R14\nM=D\n")
+        self._write("@" + label + "\nD=A\n@$$CALL\n0;JMP\n(" + label + ")\n")
+        self._routines.add('call')
+
+    def writeReturn(self):
+        '''CW.writeReturn() -> None
+
+        Writes the assembly code that is the translation of the return
+        command, a jump to the shared return routine. A function with a
+        static frame restores the pointers it saved and jumps straight
+        back, leaving the return value where it is.
+        '''
+        if self._function in self.staticFrames:
+            for index in self.staticFrames[self._function]:
+                self._write("@" + self._function + "$$pointer." + str(index) + "\nD=M\n@" + str(3 + index) + "\nM=D\n")
+            self._write("@" + self._function + "$$return\nA=M\n0;JMP\n")
+            return
+        self._write("@$$RETURN\n0;JMP\n")
+        self._routines.add('return')
+
+    def _writeCallRoutine(self):
+        '''CW._writeCallRoutine() -> None
+
+        Writes the shared routine that pushes the return address and
+        the caller's LCL, ARG, THIS and THAT, repositions ARG and LCL
+        for the callee and jumps to it.
+        '''
+        self._write("($$CALL)\n@SP\nAM=M+1\nA=A-1\nM=D\n")
+        for pointer in ['LCL', 'ARG', 'THIS', 'THAT']:
+            self._write("@" + pointer + "\nD=M\n@SP\nAM=M+1\nA=A-1\nM=D\n")
+        self._write("@R14\nD=M\n@5\nD=D+A\n@SP\nD=M-D\n@ARG\nM=D\n")
+        self._write("@SP\nD=M\n@LCL\nM=D\n@R13\nA=M\n0;JMP\n")
+
+    def _writeReturnRoutine(self):
+        '''CW._writeReturnRoutine() -> None
+
+        Writes the shared routine that moves the return value to the
+        caller's stack, restores the caller's frame and jumps to the
+        return address.
+        '''
+        self._write("($$RETURN)\n@LCL\nD=M\n@R13\nM=D\n@5\nA=D-A\nD=M\n@R14\nM=D\n")
+        self._write("@SP\nAM=M-1\nD=M\n@ARG\nA=M\nM=D\n@ARG\nD=M+1\n@SP\nM=D\n")
+        for pointer in ['THAT', 'THIS', 'ARG', 'LCL']:
+            self._write("@R13\nAM=M-1\nD=M\n@" + pointer + "\nM=D\n")
+        self._write("@R14\nA=M\n0;JMP\n")
+
+    def writePushPop(self, command, segment, index):
+        '''CW.writePushPop(str, str, int) -> None
+
+        Writes to the output file the assmebly code that is the
+        translation of the given command, where command is either
+        C_PUSH or C_POP. Of the sequences that _pushStrategies() and
+        _popStrategies() offer, the cheapest is written.
+        '''
+        if command == 'C_PUSH':
+            strategies = self._pushStrategies(segment, index)
+        else:
+            strategies = self._popStrategies(segment, index)
+        name, instructions = cheapest(strategies)
+        self._write('\n'.join(instructions))
+
+    def _fixed(self, segment):
+        '''CW._fixed(str) -> bool
+
+        Returns True if the entries of segment are at fixed addresses
+        in the current function.
+        '''
+        return segment not in self.POINTERS or (segment in ['local', 'argument']
+                                                and self._function in self.staticFrames)
+
+    def _address(self, segment, index):
+        '''CW._address(str, int) -> str
+
+        Returns the symbol or number of the fixed RAM address of a
+        temp, pointer or static entry, or of a local or argument in a
+        static frame.
+        '''
+        if segment == 'temp':
+            return str(5 + index)
+        elif segment == 'pointer':
+            return str(3 + index)
+        elif segment == 'local':
+            return self._function + "$$local." + str(index)
+        elif segment == 'argument':
+            return self._function + "$$arg." + str(index)
+        return self._static + "." + str(index)
+
+    def _walk(self, index):
+        '''CW._walk(int) -> list
+
+        Returns the instructions that, after @ of a base pointer, point
+        A at the entry index places above the base, one step at a time.
+        '''
+        if index == 0:
+            return ['A=M']
+        return ['A=M+1'] + ['A=A+1'] * (index - 1)
+
+    def _loadStrategies(self, segment, index):
+        '''CW._loadStrategies(str, int) -> list
+
+        Returns the (name, instructions) pairs of the sequences that
+        load the entry at index of segment into D.
+        '''
+        if segment == 'constant':
+            return [('constant', self._constant(index))]
+        if self._fixed(segment):
+            return [('direct', ['@' + self._address(segment, index), 'D=M'])]
+        base = '@' + self.POINTERS[segment]
+        offset = [base, 'D=M', '@' + str(index), 'A=D+A', 'D=M']
+        return [('offset', offset if index else [base, 'A=M', 'D=M']),
+                ('walk', [base] + self._walk(index) + ['D=M'])]
+
+    def _storeStrategies(self, segment, index):
+        '''CW._storeStrategies(str, int) -> list
+
+        Returns the (name, instructions) pairs of the sequences that
+        store D in the entry at index of segment. They may use the
+        stack slot at SP, which is free.
+        '''
+        if self._fixed(segment):
+            return [('direct', ['@' + self._address(segment, index), 'M=D'])]
+        base = '@' + self.POINTERS[segment]
+        #Adds the address to the value, then takes the value back out
+        #of the sum once A holds the address
+        total = ['@' + str(index), 'D=A', base, 'D=D+M', '@SP', 'A=M', 'D=D+M', 'A=D-M', 'M=D-A']
+        return [('walk', [base] + self._walk(index) + ['M=D']),
+                ('sum', ['@SP', 'A=M', 'M=D'] + total),
+                ('scratch', ['@R13', 'M=D', base, 'D=M', '@' + str(index), 'D=D+A',
+                             '@R14', 'M=D', '@R13', 'D=M', '@R14', 'A=M', 'M=D'])]
+
+    def _pushStrategies(self, segment, index):
+        '''CW._pushStrategies(str, int) -> list
+
+        Returns the (name, instructions) pairs of the sequences that
+        push the entry at index of segment.
+        '''
+        return [(name, code + ['@SP', 'AM=M+1', 'A=A-1', 'M=D'])
+                for name, code in self._loadStrategies(segment, index)]
+
+    def _popStrategies(self, segment, index):
+        '''CW._popStrategies(str, int) -> list
+
+        Returns the (name, instructions) pairs of the sequences that
+        pop the top of the stack into the entry at index of segment.
+        '''
+        strategies = [(name, ['@SP', 'AM=M-1', 'D=M'] + code)
+                      for name, code in self._storeStrategies(segment, index) if name != 'sum']
+        if not self._fixed(segment):
+            #The value is added to the address straight from the stack
+            strategies.append(('sum', ['@' + str(index), 'D=A', '@' + self.POINTERS[segment], 'D=D+M',
+                                       '@SP', 'AM=M-1', 'D=D+M', 'A=D-M', 'M=D-A']))
+        return strategies
+
+    def _constant(self, value):
+        '''CW._constant(int) -> list
+
+        Returns the instructions that load the constant value into D.
+        Negative constants only come from constant folding.
+        '''
+        if value in [-1, 0, 1]:
+            return ['D=' + str(value)]
+        elif value == -32768:
+            return ['@32767', 'D=-A', 'D=D-1']
+        elif value < 0:
+            return ['@' + str(-value), 'D=-A']
+        return ['@' + str(value), 'D=A']
+
+    def close(self):
+        '''CW.close() -> None
+
+        Writes the bootstrap code, which calls Sys.init if the program
+        defines it, and the shared routines, and writes the output file.
+        The bootstrap goes before the body, so a spooled body is copied
+        after it.
+        '''
+        #Code outside of the vm files is mapped to a function of its own
+        self._origin = ('', 0, '$$END', '')
+        self._write("(INFINITE_LOOP)\n@INFINITE_LOOP\n0;JEQ\n")
+        if 'Sys.init' in self._functions:
+            #The bootstrap, written below, calls Sys.init
+            self._routines.add('call')
+        for routine in ['call', 'return', 'eq', 'gt', 'lt']:
+            self._origin = ('', 0, '$$' + routine.upper(), '')
+            if routine == 'call' and routine in self._routines:
+                self._writeCallRoutine()
+            elif routine == 'return' and routine in self._routines:
+                self._writeReturnRoutine()
+            elif routine in self._routines:
+                self._writeCompareRoutine(routine)
+        body = self.instructions
+        self.instructions = []
+        spool = self._spool
+        self._spool = None
+        bodyOrigins = self.origins
+        if self.origins is not None:
+            self.origins = []
+        self._origin = ('', 0, '$$BOOTSTRAP', '')
+        self._write("@256\nD=A\n@SP\nM=D\n")
+        if 'Sys.init' in self._functions:
+            #Falls into the end loop should Sys.init ever return
+            self._function = '$$BOOTSTRAP'
+            self._count = 0
+            self.writeCall('Sys.init', 0)
+            self._write("@INFINITE_LOOP\n0;JMP\n")
+        self.instructions.extend(body)
+        if self.origins is not None:
+            self.origins.extend(bodyOrigins)
+        if self.optimize:
+            optimizer = Peephole(self.instructions, self.origins)
+            self.instructions = optimizer.run()
+            self.origins = optimizer.origins
+            optimizer.report()
+        self.output = open(self.fname, 'wb' if self.format == 'bin' else 'w')
+        if self.format == 'asm':
+            self.output.write('\n'.join(self.instructions) + '\n')
+            if spool is not None:
+                spool.seek(0)
+                shutil.copyfileobj(spool, self.output)
+                spool.close()
+        else:
+            code, symbols = assemble(self.instructions, self.fname)
+            if self.format == 'hack':
+                self.output.write(''.join(format(word, '016b') + '\n' for word in code))
+            else:
+                self.output.write(struct.pack('>{}H'.format(len(code)), *code))
+        self.output.close()
+        if self.origins is not None:
+            self._writeSourceMap()
+
+    def _writeSourceMap(self):
+        '''CW._writeSourceMap() -> None
+
+        Writes the source map next to the output file: one line per
+        instruction with its ROM address, vm file, line number, function
+        and command, separated by tabs. Labels take no ROM and are left
+        out.
+        '''
+        address = 0
+        with open(str(Path(self.fname).with_suffix('.map')), 'w') as mapFile:
+            for instruction, origin in zip(self.instructions, self.origins):
+                if instruction[0] == '(':
+                    continue
+                vmfile, line, function, command = origin
+                mapFile.write('{}\t{}\t{}\t{}\t{}\n'.format(address, vmfile, line, function, command))
+                address = address + 1
+
+class TosCodeWriter(CodeWriter):
+    '''Translates VM commands into Hack assembly code that keeps the top
+    of the VM stack in the D register across commands. The cached value
+    is only stored to the stack when a command needs it in memory: at
+    labels, jumps, calls and returns, between files and before a push.
+    With compare='shared', comparisons store it too, as the shared
+    routines take both operands from memory and leave the result there.
+    '''
+
+    def __init__(self, fname, optimize=False, compare='inline', sourceMap=False, format='asm',
+                 staticFrames=None):
+        '''Opens the output file at fname and gets ready to write to it,
+        as CodeWriter does.
+        '''
+        CodeWriter.__init__(self, fname, optimize, compare, sourceMap, format, staticFrames)
+        self._cached = False
+
+    def __str__(self):
+        return 'TosCodeWriter object.'
+
+    def _spill(self):
+        '''TCW._spill() -> None
+
+        Stores the value cached in D on top of the stack in memory.
+        '''
+        if self._cached:
+            self._write("@SP\nAM=M+1\nA=A-1\nM=D\n")
+            self._cached = False
+
+    def _fill(self):
+        '''TCW._fill() -> None
+
+        Pops the top of the stack into D, unless it is already there.
+        '''
+        if not self._cached:
+            self._write("@SP\nAM=M-1\nD=M\n")
+            self._cached = True
+
+    def setFileName(self, fname):
+        self._spill()
+        CodeWriter.setFileName(self, fname)
+
+    def fragment(self):
+        self._spill()
+        return CodeWriter.fragment(self)
+
+    def writeArithmetic(self, command):
+        '''TCW.writeArithmetic(str) -> None
+
+        Writes the assembly code that is the translation of the given
+        arithmetic command, leaving its result in D, but for comparisons
+        through a shared routine, which leave it on the stack.
+        '''
+        if self.compare == 'shared' and command in ['eq', 'gt', 'lt']:
+            #D carries the return address to the routine
+            self._spill()
+            self._writeSharedCompare(command)
+            return
+        self._fill()
+        if command == 'neg':
+            self._write("D=-D\n")
+        elif command == 'not':
+            self._write("D=!D\n")
+        elif command == 'add':
+            self._write("@SP\nAM=M-1\nD=D+M\n")
+        elif command == 'sub':
+            self._write("@SP\nAM=M-1\nD=M-D\n")
+        elif command == 'and':
+            self._write("@SP\nAM=M-1\nD=D&M\n")
+        elif command == 'or':
+            self._write("@SP\nAM=M-1\nD=D|M\n")
+        else:
+            true = self._prefix + "TRUE" + str(self._count)
+            end = self._prefix + "FALSE" + str(self._count)
+            self._write("@SP\nAM=M-1\nD=M-D\n@" + true + "\nD;J" + command.upper() + "\n")
+            self._write("D=0\n@" + end + "\n0;JMP\n(" + true + ")\nD=-1\n(" + end + ")\n")
+            self._count = self._count + 1
+
+    def writePushPop(self, command, segment, index):
+        '''TCW.writePushPop(str, str, int) -> None
+
+        Writes the assembly code that is the translation of the given
+        command, where command is either C_PUSH or C_POP. A push leaves
+        the value in D and a pop stores the value in D.
+        '''
+        if command == 'C_PUSH':
+            self._spill()
+            CodeWriter.writePushPop(self, command, segment, index)
+            self._cached = True
+        else:
+            self._fill()
+            CodeWriter.writePushPop(self, command, segment, index)
+            self._cached = False
+
+    def _pushStrategies(self, segment, index):
+        return self._loadStrategies(segment, index)
+
+    def _popStrategies(self, segment, index):
+        return self._storeStrategies(segment, index)
+
+    def writeLabel(self, label):
+        self._spill()
+        CodeWriter.writeLabel(self, label)
+
+    def writeGoto(self, label):
+        self._spill()
+        CodeWriter.writeGoto(self, label)
+
+    def writeIf(self, label, jump=None):
+        '''TCW.writeIf(str, str) -> None
+
+        Writes the assembly code that is the translation of the given
+        if-goto command, testing the condition straight from D when it
+        is cached there. A fused comparison (see CodeWriter.writeIf())
+        subtracts the cached operand from the one below it.
+        '''
+        if jump is not None:
+            self._fill()
+            self._write("@SP\nAM=M-1\nD=M-D\n@" + self._function + "$" + label + "\nD;" + jump + "\n")
+            self._cached = False
+        elif self._cached:
+            self._write("@" + self._function + "$" + label + "\nD;JNE\n")
+            self._cached = False
+        else:
+            CodeWriter.writeIf(self, label)
+
+    def writeFunction(self, functionName, numLocals):
+        self._spill()
+        CodeWriter.writeFunction(self, functionName, numLocals)
+
+    def writeCall(self, functionName, numArgs):
+        self._spill()
+        CodeWriter.writeCall(self, functionName, numArgs)
+
+    def writeReturn(self):
+        self._spill()
+        CodeWriter.writeReturn(self)
+
+    def close(self):
+        self._spill()
+        CodeWriter.close(self)
+
+#The CodeWriter class of each --backend
+BACKENDS = {'stack': CodeWriter, 'tos': TosCodeWriter}
+
+def newWriter(fname, settings, optimize=False, format='asm'):
+    '''newWriter(str, dict, bool, str) -> CodeWriter
+
+    Returns a code writer for fname of the class given by the 'backend'
+    entry of settings, created with the other entries as keyword
+    arguments.
+    '''
+    settings = dict(settings)
+    backend = BACKENDS[settings.pop('backend', 'stack')]
+    return backend(fname, optimize=optimize, format=format, **settings)
+
+class Peephole(object):
+    '''Rewrites redundant instruction sequences in the Hack assembly
+    generated by a CodeWriter. Every rule relies on the stack slots at
+    and above SP being dead, which holds for all code the CodeWriter
+    emits.
+    '''
+
+    #Tail of every push: the value in D is stored on top of the stack.
+    PUSH = ['@SP', 'AM=M+1', 'A=A-1', 'M=D']
+    #Tail of a pop that adds the address to the value on the stack.
+    SUM = ['@SP', 'AM=M-1', 'D=D+M', 'A=D-M', 'M=D-A']
+
+    def __init__(self, instructions, origins=None):
+        '''Gets ready to optimize the list of instructions. If origins
+        is given, it holds the origin of each instruction (see
+        CodeWriter) and is kept in step with the instructions.
+        '''
+        self.instructions = list(instructions)
+        self.origins = None if origins is None else list(origins)
+        self.removed = {'push-pop': 0, 'sp-reload': 0, 'dead-clear': 0}
+
+    def __str__(self):
+        return 'Peephole object.'
+
+    def run(self):
+        '''PH.run() -> list
+
+        Applies the rules until none of them matches any more and
+        returns the optimized list of instructions.
+        '''
+        self._rewrite([('dead-clear', self._deadClear)])
+        rules = [('push-pop', self._pushPop), ('sp-reload', self._spReload)]
+        while self._rewrite(rules):
+            pass
+        return self.instructions
+
+    def report(self):
+        '''PH.report() -> None
+
+        Prints how many instructions each rule removed.
+        '''
+        print('Peephole optimizer:')
+        for rule, count in self.removed.items():
+            print('\t{}: removed {} instructions'.format(rule, count))
+        print('\ttotal: removed {} instructions'.format(sum(self.removed.values())))
+
+    def _rewrite(self, rules):
+        '''PH._rewrite(list) -> bool
+
+        Makes one pass over the instructions, replacing every sequence
+        matched by one of the (name, rule) pairs in rules. Returns True
+        if anything was replaced.
+        '''
+        code = self.instructions
+        origins = self.origins
+        result = []
+        resultOrigins = []
+        changed = False
+        i = 0
+        while i < len(code):
+            for name, rule in rules:
+                match = rule(code, i)
+                if match is not None:
+                    length, replacement = match
+                    result.extend(replacement)
+                    if origins is not None:
+                        #A replacement that keeps the tail of the match
+                        #keeps its origins, otherwise the head's are used
+                        start = i
+                        if replacement and code[i+length-len(replacement):i+length] == replacement:
+                            start = i + length - len(replacement)
+                        resultOrigins.extend(origins[start:start+len(replacement)])
+                    self.removed[name] += length - len(replacement)
+                    i += length
+                    changed = True
+                    break
+            else:
+                result.append(code[i])
+                if origins is not None:
+                    resultOrigins.append(origins[i])
+                i += 1
+        self.instructions = result
+        if origins is not None:
+            self.origins = resultOrigins
+        return changed
+
+    def _deadClear(self, code, i):
+        '''Drops the M=0 that clears a stack slot right after SP has
+        been moved below it.'''
+        if code[i:i+3] == ['@SP', 'AM=M-1', 'M=0']:
+            return 3, ['@SP', 'AM=M-1']
+        if code[i:i+4] == ['@SP', 'AM=M-1', 'D=M', 'M=0']:
+            return 4, ['@SP', 'AM=M-1', 'D=M']
+
+    def _spReload(self, code, i):
+        '''Drops loads of SP and of the top of the stack whose value is
+        already in a register.'''
+        if code[i:i+6] == self.PUSH + ['@SP', 'A=M-1']:
+            return 6, self.PUSH
+        if code[i:i+5] == ['@SP', 'A=M-1', 'D=M', '@SP', 'AM=M-1']:
+            return 5, ['@SP', 'AM=M-1', 'D=M']
+        if code[i][0] == '@' and code[i+1:i+2] and code[i+1][0] == '@':
+            return 2, [code[i+1]]
+
+    def _pushPop(self, code, i):
+        '''Turns a push directly followed by a pop into a move of the
+        value in D, without going through the stack.'''
+        if code[i:i+4] != self.PUSH:
+            return None
+        #push followed by the operand pop of a binary command
+        if code[i+4:i+10] == ['@SP', 'A=M-1', 'D=M', '@SP', 'AM=M-1', 'A=A-1']:
+            return 10, ['@SP', 'A=M-1']
+        if code[i+4:i+8] == ['@SP', 'AM=M-1', 'D=M', 'A=A-1']:
+            return 8, ['@SP', 'A=M-1']
+        if code[i+4:i+7] == ['@SP', 'AM=M-1', 'D=M'] and code[i+7:i+8] and code[i+7][0] == '@':
+            return 7, []
+        #push followed by a pop that adds the address to the value,
+        #which can leave the value in the free slot at SP instead
+        if code[i+5:i+6] == ['D=A'] and code[i+7:i+8] == ['D=D+M'] and code[i+8:i+13] == self.SUM:
+            return 13, ['@SP', 'A=M', 'M=D'] + code[i+4:i+8] + ['@SP', 'A=M', 'D=D+M', 'A=D-M', 'M=D-A']
+
+#Bits a c1..c6 of every computation the Hack CPU knows
+COMP = {'0': '0101010', '1': '0111111', '-1': '0111010',
+        'D': '0001100', 'A': '0110000', '!D': '0001101', '!A': '0110001',
+        '-D': '0001111', '-A': '0110011', 'D+1': '0011111', 'A+1': '0110111',
+        'D-1': '0001110', 'A-1': '0110010', 'D+A': '0000010', 'D-A': '0010011',
+        'A-D': '0000111', 'D&A': '0000000', 'D|A': '0010101',
+        'M': '1110000', '!M': '1110001', '-M': '1110011', 'M+1': '1110111',
+        'M-1': '1110010', 'D+M': '1000010', 'D-M': '1010011', 'M-D': '1000111',
+        'D&M': '1000000', 'D|M': '1010101',
+        'A+D': '0000010', 'A&D': '0000000', 'A|D': '0010101',
+        'M+D': '1000010', 'M&D': '1000000', 'M|D': '1010101'}
+
+JUMP = {'': 0, 'JGT': 1, 'JEQ': 2, 'JGE': 3, 'JLT': 4, 'JNE': 5, 'JLE': 6, 'JMP': 7}
+
+PREDEFINED = {'SP': 0, 'LCL': 1, 'ARG': 2, 'THIS': 3, 'THAT': 4,
+              'SCREEN': 16384, 'KBD': 24576}
+PREDEFINED.update(('R' + str(i), i) for i in range(16))
+
+def assemble(lines, fname='<assembly>'):
+    '''assemble(list, str) -> tuple
+
+    Assembles the Hack assembly instructions in lines and returns a
+    tuple of the machine code, as a list of 16-bit words, and the symbol
+    table, which maps labels to ROM addresses and variables to RAM
+    addresses. Raises ValueError, with fname and the line, on a number
+    above 32767, which would be read as a C-instruction.
+    '''
+    instructions = []
+    symbols = dict(PREDEFINED)
+    for number, line in enumerate(lines, 1):
+        line = line.split('//')[0].strip()
+        if line.startswith('('):
+            symbols[line[1:-1]] = len(instructions)
+        elif line:
+            if line[0] == '@' and line[1:].isdigit() and int(line[1:]) > 32767:
+                raise ValueError('{}:{}: constant out of range {}'.format(fname, number, line))
+            instructions.append(line)
+    code = []
+    #Generated code repeats a few instructions over and over, so each
+    #one is only encoded the first time it is seen
+    encodings = {}
+    variable = 16
+    for instruction in instructions:
+        word = encodings.get(instruction)
+        if word is not None:
+            code.append(word)
+            continue
+        if instruction[0] == '@':
+            value = instruction[1:]
+            if not value.isdigit():
+                if value not in symbols:
+                    symbols[value] = variable
+                    variable = variable + 1
+                value = symbols[value]
+            word = int(value)
+        else:
+            dest, _, comp = instruction.rpartition('=')
+            comp, _, jump = comp.partition(';')
+            word = 0b1110000000000000 | int(COMP[comp], 2) << 6 | JUMP[jump]
+            word = word | 32 * ('A' in dest) | 16 * ('D' in dest) | 8 * ('M' in dest)
+        encodings[instruction] = word
+        code.append(word)
+    return code, symbols
+
+class CommandArray(object):
+    '''Holds the command records of a vm file in a compact form: one
+    column per field, each an array of machine integers. Commands are
+    stored as an opcode (an index into OPCODES), a segment (an index
+    into SEGMENTS), an index and a name, the id of a label or function
+    name in a table of interned strings. Supports len(), indexing and
+    iteration, which give the same records a Lexer yields, and can be
+    translated without building them (see CodeWriter.writeCode()).
+    '''
+
+    #The command type and keyword of every opcode, in the order of
+    #Lexer.KEYWORDS, so that push and pop come first and the arithmetic
+    #commands last
+    OPCODES = list(Lexer.KEYWORDS.values())
+    PUSH, POP, LABEL, GOTO, IF, FUNCTION, CALL, RETURN, ARITHMETIC = range(9)
+    #Arithmetic commands are known by their keyword, the others by type
+    CODES = {name if command == 'C_ARITHMETIC' else command: opcode
+             for opcode, (command, name) in enumerate(OPCODES)}
+    SEGMENTS = list(Lexer.SEGMENTS.values())
+    SEGMENT_CODES = {segment: code for code, segment in enumerate(SEGMENTS)}
+    #The opcode of every keyword, as Lexer.code() reads them
+    KEYWORDS = {keyword: opcode for opcode, keyword in enumerate(Lexer.KEYWORDS)}
+    #The segment code of every valid push and pop, keyed on their first
+    #two words as Lexer.code() reads them
+    ACCESSES = {(keyword, segment): code for keyword in [b'push', b'pop']
+                for code, segment in enumerate(Lexer.SEGMENTS) if (keyword, segment) != (b'pop', b'constant')}
+    #The jump of a fused if-goto (see fuseBranches()) is kept as its
+    #Hack encoding in the index, 0 standing for an ordinary if-goto
+    JUMPS = sorted(JUMP, key=JUMP.get)
+
+    def __init__(self, records=()):
+        '''Stores the command records, given as any iterable of
+        (command type, arg1, arg2, line) tuples.
+        '''
+        self.opcodes = array('B')
+        self.segments = array('B')
+        self.indexes = array('i')
+        self.names = array('I')
+        self.lines = array('I')
+        #Id 0 stands for no name
+        self.strings = [None]
+        self._ids = {None: 0}
+        self.extend(records)
+
+    def __str__(self):
+        return 'CommandArray object.'
+
+    def __getstate__(self):
+        #The ids are rebuilt from the strings, to keep pickles small
+        state = dict(self.__dict__)
+        del state['_ids']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._ids = {string: number for number, string in enumerate(self.strings)}
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __getitem__(self, position):
+        return self._decode(self.opcodes[position], self.segments[position],
+                            self.indexes[position], self.names[position], self.lines[position])
+
+    def __iter__(self):
+        decode = self._decode
+        for opcode, segment, index, name, line in zip(self.opcodes, self.segments, self.indexes,
+                                                      self.names, self.lines):
+            yield decode(opcode, segment, index, name, line)
+
+    def __eq__(self, other):
+        if not isinstance(other, CommandArray):
+            return NotImplemented
+        return (self.opcodes == other.opcodes and self.segments == other.segments
+                and self.indexes == other.indexes and self.lines == other.lines
+                and [self.strings[number] for number in self.names]
+                == [other.strings[number] for number in other.names])
+
+    def _decode(self, opcode, segment, index, name, line):
+        '''Returns the record of a command from its fields.'''
+        command, keyword = self.OPCODES[opcode]
+        if opcode >= self.ARITHMETIC:
+            return (command, keyword, None, line)
+        if opcode <= self.POP:
+            return (command, self.SEGMENTS[segment], index, line)
+        if opcode == self.RETURN:
+            return (command, None, None, line)
+        if opcode == self.IF:
+            return (command, self.strings[name], self.JUMPS[index] or None, line)
+        if opcode == self.LABEL or opcode == self.GOTO:
+            return (command, self.strings[name], None, line)
+        return (command, self.strings[name], index, line)
+
+    def intern(self, string):
+        '''CA.intern(str) -> int
+
+        Returns the id of string in the string table, adding it if
+        needed. Strings are also interned with sys.intern(), so that the
+        tables of different files share them.
+        '''
+        number = self._ids.get(string)
+        if number is None:
+            number = self._ids[string] = len(self.strings)
+            self.strings.append(sys.intern(string))
+        return number
+
+    def append(self, record):
+        '''CA.append(tuple) -> None
+
+        Adds the command record to the end.
+        '''
+        self.extend([record])
+
+    def extend(self, records):
+        '''CA.extend(iterable) -> None
+
+        Adds the command records to the end. The fields are gathered in
+        lists and added to the arrays at once, which is faster than
+        adding them one by one.
+        '''
+        codes = self.CODES
+        segmentCodes = self.SEGMENT_CODES
+        intern = self.intern
+        columns = ([], [], [], [], [])
+        opcodes, segments, indexes, names, lines = columns
+        for command, arg1, arg2, line in records:
+            opcode = codes.get(command)
+            if opcode is None:
+                opcodes.append(codes[arg1])
+                segments.append(0)
+                indexes.append(0)
+                names.append(0)
+            elif opcode <= self.POP:
+                opcodes.append(opcode)
+                segments.append(segmentCodes[arg1])
+                indexes.append(arg2)
+                names.append(0)
+            else:
+                opcodes.append(opcode)
+                segments.append(0)
+                if opcode == self.IF:
+                    indexes.append(JUMP[arg2 or ''])
+                else:
+                    indexes.append(arg2 or 0)
+                names.append(intern(arg1) if opcode != self.RETURN else 0)
+            lines.append(line)
+        for column, values in zip([self.opcodes, self.segments, self.indexes, self.names, self.lines],
+                                  columns):
+            column.extend(values)
+
+    def pack(self):
+        '''CA.pack() -> bytes
+
+        Returns the commands as bytes. CommandArrays built from the same
+        records pack to the same bytes.
+        '''
+        columns = [self.opcodes, self.segments, self.indexes, self.names, self.lines]
+        return b''.join(column.tobytes() for column in columns) + '\0'.join(self.strings[1:]).encode()
+
+def compact(records):
+    '''compact(iterable) -> CommandArray
+
+    Returns the command records as a CommandArray, or records itself if
+    it already is one.
+    '''
+    if isinstance(records, CommandArray):
+        return records
+    return CommandArray(records)
+
+class FragmentCache(object):
+    '''Keeps the fragment of every translated vm file in a directory on
+    disk, keyed on a hash of the file's content, its name, the CodeWriter
+    settings and the translator itself. The least recently used entries
+    are evicted once the directory grows past its size limit.
+    '''
+
+    def __init__(self, directory, limit):
+        '''Opens the cache in directory, creating it if needed. limit is
+        the maximum size of the cache in bytes.
+        '''
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.limit = limit
+        #Any change to the translator invalidates every entry
+        self._translator = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+        self.hits = 0
+
+    def __str__(self):
+        return 'FragmentCache object.'
+
+    def key(self, vmfile, settings, commands=None):
+        '''FC.key(str, dict, list) -> str
+
+        Returns the key of the fragment of the vm file at vmfile when
+        translated with the CodeWriter settings. If the file is to be
+        translated from the command records in commands, rather than
+        from its content, the key is computed from those records.
+        '''
+        digest = hashlib.sha256(self._translator.encode())
+        #Static symbols and labels depend on the file name
+        digest.update(Path(vmfile).name.encode() + b'\0')
+        digest.update(repr(sorted(settings.items())).encode() + b'\0')
+        if commands is None:
+            digest.update(Path(vmfile).read_bytes())
+        else:
+            digest.update(compact(commands).pack())
+        return digest.hexdigest()
+
+    def get(self, key):
+        '''FC.get(str) -> tuple
+
+        Returns the fragment stored under key, or None if there is none.
+        '''
+        entry = self.directory / (key + '.json')
+        try:
+            with open(entry) as cacheFile:
+                fragment = tuple(json.load(cacheFile))
+        except (OSError, ValueError):
+            return None
+        #Marks the entry as recently used
+        os.utime(entry)
+        self.hits = self.hits + 1
+        return fragment
+
+    def put(self, key, fragment):
+        '''FC.put(str, tuple) -> None
+
+        Stores fragment under key.
+        '''
+        entry = self.directory / (key + '.json')
+        temporary = entry.with_suffix('.tmp' + str(os.getpid()))
+        with open(temporary, 'w') as cacheFile:
+            json.dump(fragment, cacheFile)
+        os.replace(temporary, entry)
+
+    def evict(self):
+        '''FC.evict() -> None
+
+        Removes the least recently used entries until the cache is no
+        larger than its limit.
+        '''
+        entries = [(entry.stat(), entry) for entry in self.directory.glob('*.json')]
+        entries.sort(key=lambda item: item[0].st_mtime)
+        size = sum(stat.st_size for stat, entry in entries)
+        for stat, entry in entries:
+            if size <= self.limit:
+                break
+            entry.unlink()
+            size = size - stat.st_size
+
 def printUsage():
-    '''printUsage() -> None
-     
-    Prints infomration on how to call this file.
-    '''
-    print("Usage: VMtranslator source")
-    print("source is one of")
-    print("\ta .vm file\n\ta directory containing .vm files")
- 
+    '''printUsage() -> None
+
+    Prints infomration on how to call this file.
+    '''
+    print("Usage: VMtranslator [options] source")
+    print("source is one of")
+    print("\ta .vm file\n\ta directory containing .vm files")
+    print("options are")
+    print("\t--optimize\trun the peephole optimizer over the generated code")
+    print("\t--compare=inline|shared\texpand eq, gt and lt in place (default) or")
+    print("\t\t\tcall one shared routine per operator")
+    print("\t--backend=stack|tos\tkeep the whole VM stack in memory (default) or")
+    print("\t\t\tcache its top in the D register")
+    print("\t--jobs=N\ttranslate the files of a directory in N processes")
+    print("\t--inline[=N]\treplace calls to functions of at most N commands (default")
+    print("\t\t\t10) by their body")
+    print("\t--prune\t\tdrop the functions that cannot be reached from Sys.init")
+    print("\t--fold\t\tevaluate arithmetic on constants at translation time")
+    print("\t--static-frames\tgive the locals and arguments of non-recursive functions")
+    print("\t\t\tfixed addresses, and call them without the call routine")
+    print("\t--fuse\t\tjump on eq, gt and lt directly followed by if-goto without")
+    print("\t\t\tpushing their result")
+    print("\t--cache\t\treuse the translation of unchanged files from earlier runs")
+    print("\t--cache-size=MB\tlimit the size of the cache (default 64)")
+    print("\t--format=asm|hack|bin\twrite assembly (default), or assemble it and")
+    print("\t\t\twrite .hack text or big-endian binary machine code")
+    print("\t--watch[=SECONDS]\tkeep running and rebuild the output whenever a")
+    print("\t\t\tvm file changes, checking every SECONDS (default 0.5)")
+    print("\t--costs\t\tprint the cost of every push and pop sequence and exit")
+    print("\t--map\t\twrite the vm command of every instruction to a .map file")
+
+#The values allowed for the options that take one of a few
+CHOICES = {'format': ['asm', 'hack', 'bin'], 'backend': list(BACKENDS), 'compare': ['inline', 'shared']}
+
+def getOptions():
+    '''getOptions() -> dict
+
+    Returns a dictionary of the options given on the command line. Each
+    --name=value maps name to value and each --name maps name to True.
+    '''
+    options = {}
+    for arg in sys.argv[1:]:
+        if arg.startswith('--'):
+            name, _, value = arg[2:].partition('=')
+            options[name] = value if value else True
+    return options
+
 def getFileNames():
-    '''getFileNames() -> tuple
- 
-    Returns a tuple contianing the name of the output ASM file and a
-    list of names of the VM files to operate on, as per the call to
-    the program from command line.
-    '''
-    if len(sys.argv) != 2:
-        printUsage()
-        print('Invalid call:', end=' ')
-        for x in sys.argv:
-            print(x, end=' ')
-        print()
-        sys.exit()  # End program.
-    p = Path(sys.argv[1])
-    fname = str(p)
-    if p.is_dir():
-        while fname[-1] == '/':
-            fname = fname[:-1]
-        asmFname = fname + '.asm'
-        vmFiles = list(p.glob('*.vm'))
-    elif fname[-3:] == '.vm' and p.exists():
-        asmFname = fname[:-3]+'.asm'
-        vmFiles = [p]
-    else:
-        printUsage()
-        print('Invalid file:', fname,'\nAborting!')
-        sys.exit() # End program.
-    vmFiles = [str(f) for f in vmFiles]
-    return (asmFname, vmFiles)
- 
+    '''getFileNames() -> tuple
+
+    Returns a tuple contianing the name of the output ASM file and a
+    list of names of the VM files to operate on, as per the call to
+    the program from command line.
+    '''
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) != 1:
+        printUsage()
+        print('Invalid call:', end=' ')
+        for x in sys.argv:
+            print(x, end=' ')
+        print()
+        sys.exit()  # End program.
+    p = Path(args[0])
+    fname = str(p)
+    if p.is_dir():
+        while fname[-1] == '/':
+            fname = fname[:-1]
+        asmFname = fname + '.asm'
+    elif fname[-3:] == '.vm' and p.exists():
+        asmFname = fname[:-3]+'.asm'
+    else:
+        printUsage()
+        print('Invalid file:', fname,'\nAborting!')
+        sys.exit() # End program.
+    return (asmFname, listVmFiles(p))
+
+def listVmFiles(source):
+    '''listVmFiles(Path) -> list
+
+    Returns the names of the VM files in the directory source, or just
+    source if it is a file.
+    '''
+    vmFiles = list(source.glob('*.vm')) if source.is_dir() else [source]
+    #Sorted, so that the files are always translated in the same order
+    return sorted(str(f) for f in vmFiles)
+
+def formatCommand(command, arg1=None, arg2=None):
+    '''formatCommand(str, str, int) -> str
+
+    Returns the vm source of a command given as its type and arguments,
+    as produced by a Lexer.
+    '''
+    if command == 'C_ARITHMETIC':
+        return arg1
+    words = [COMMANDS[command], arg1, arg2]
+    return ' '.join(str(word) for word in words if word is not None)
+
+def loadProgram(vmFiles):
+    '''loadProgram(list) -> dict
+
+    Returns a dictionary mapping each of the VM files to its command
+    records, as a CommandArray, for the passes that work on the whole
+    program. The passes may replace them with lists of records.
+    '''
+    return {vmfile: Lexer(vmfile).code() for vmfile in vmFiles}
+
+def callGraph(program):
+    '''callGraph(dict) -> dict
+
+    Returns a dictionary mapping the name of every function defined in
+    program to the set of functions it calls. Calls made outside of any
+    function are listed under None.
+    '''
+    graph = {None: set()}
+    for commands in program.values():
+        function = None
+        for command, arg1, arg2, line in commands:
+            if command == 'C_FUNCTION':
+                function = arg1
+                graph[function] = set()
+            elif command == 'C_CALL':
+                graph[function].add(arg1)
+    return graph
+
+def _signed16(value):
+    '''Returns value wrapped to a 16-bit two's complement integer.'''
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+#Evaluates each arithmetic command the way the generated code does. The
+#comparisons test the sign of the 16-bit difference, as D=M-D does.
+FOLDS = {'add': lambda x, y: _signed16(x + y),
+         'sub': lambda x, y: _signed16(x - y),
+         'and': lambda x, y: x & y,
+         'or': lambda x, y: x | y,
+         'eq': lambda x, y: -1 if _signed16(x - y) == 0 else 0,
+         'gt': lambda x, y: -1 if _signed16(x - y) > 0 else 0,
+         'lt': lambda x, y: -1 if _signed16(x - y) < 0 else 0,
+         'neg': lambda x: _signed16(-x),
+         'not': lambda x: ~x}
+
+#The constant operand that leaves the other operand of a command
+#unchanged, and whether it may come first.
+IDENTITIES = {'add': (0, True), 'sub': (0, False), 'or': (0, True), 'and': (-1, True)}
+
+def foldConstants(commands):
+    '''foldConstants(list) -> list
+
+    Returns the command records with every arithmetic command on
+    constant operands replaced by a push of its result, and with the
+    operations that leave their operand unchanged (adding 0, and with
+    -1, two neg or two not in a row, ...) removed. Folded constants may
+    be negative; CodeWriter.writePushPop() accepts them.
+    '''
+    folded = []
+    for record in commands:
+        command, arg1, arg2, line = record
+        if command != 'C_ARITHMETIC':
+            folded.append(record)
+            continue
+        operands = []
+        for previous in folded[-2:]:
+            if previous[0] == 'C_PUSH' and previous[1] == 'constant':
+                operands.append(previous[2])
+            else:
+                operands = []
+        if arg1 in ['neg', 'not']:
+            if operands:
+                folded[-1] = ('C_PUSH', 'constant', FOLDS[arg1](operands[-1]), line)
+            elif folded and folded[-1][0] == 'C_ARITHMETIC' and folded[-1][1] == arg1:
+                folded.pop()
+            else:
+                folded.append(record)
+        elif len(operands) == 2:
+            folded[-2:] = [('C_PUSH', 'constant', FOLDS[arg1](*operands), line)]
+        elif arg1 in IDENTITIES and operands == [IDENTITIES[arg1][0]]:
+            #x op identity
+            folded.pop()
+        elif (arg1 in IDENTITIES and IDENTITIES[arg1][1] and len(folded) > 1
+              and folded[-1][0] == 'C_PUSH' and folded[-2][:2] == ('C_PUSH', 'constant')
+              and folded[-2][2] == IDENTITIES[arg1][0]):
+            #identity op x, where x is a single push
+            del folded[-2]
+        else:
+            folded.append(record)
+    return folded
+
+#The jump on the difference of the operands of each comparison that is
+#taken when the comparison is true, and when it is false
+BRANCHES = {'lt': ('JLT', 'JGE'), 'gt': ('JGT', 'JLE'), 'eq': ('JEQ', 'JNE')}
+
+def fuseBranches(commands):
+    '''fuseBranches(list) -> list
+
+    Returns the command records with every comparison that is directly
+    followed by if-goto, possibly through a run of not, replaced by one
+    C_IF record with the jump to take as arg2 (see BRANCHES). The
+    CodeWriter then branches on the difference of the operands without
+    pushing the boolean. Must run after the other passes, as none of
+    them expects such records.
+    '''
+    fused = []
+    for record in commands:
+        command, arg1, arg2, line = record
+        if command == 'C_IF':
+            start = len(fused)
+            while start > 0 and fused[start-1][:2] == ('C_ARITHMETIC', 'not'):
+                start = start - 1
+            if start > 0 and fused[start-1][0] == 'C_ARITHMETIC' and fused[start-1][1] in BRANCHES:
+                negated = (len(fused) - start) % 2 == 1
+                jump = BRANCHES[fused[start-1][1]][negated]
+                del fused[start-1:]
+                fused.append(('C_IF', arg1, jump, line))
+                continue
+        fused.append(record)
+    return fused
+
+def eliminateDeadFunctions(program):
+    '''eliminateDeadFunctions(dict) -> dict
+
+    Removes from program the functions that cannot be reached from
+    Sys.init or from code outside of any function, and returns a
+    dictionary mapping the name of each removed function to its command
+    records. Nothing is removed if the program does not define Sys.init,
+    as it then has no entry point.
+    '''
+    graph = callGraph(program)
+    if 'Sys.init' not in graph:
+        return {}
+    reachable = set()
+    pending = [None, 'Sys.init']
+    while pending:
+        function = pending.pop()
+        if function not in reachable:
+            reachable.add(function)
+            pending.extend(graph.get(function, ()))
+    removed = {}
+    for vmfile, commands in program.items():
+        kept = []
+        function = None
+        for record in commands:
+            if record[0] == 'C_FUNCTION':
+                function = record[1]
+            if function in reachable:
+                kept.append(record)
+            else:
+                removed.setdefault(function, []).append(record)
+        #Files with nothing removed keep their records as they were
+        if len(kept) < len(commands):
+            program[vmfile] = kept
+    return removed
+
+#Largest function, in commands, that inlineFunctions() copies into all
+#of its call sites. A function called from one site only may be four
+#times larger, as --prune then removes the original.
+INLINE_SIZE = 10
+
+def _balanced(body):
+    '''Returns True if body, the commands of a function, leaves the
+    stack empty at every label and jump and holds just the return value
+    at every return, as the Jack compiler's code does. Inlined bodies
+    and static frames rely on that, as they have no return that cleans
+    up after the body.'''
+    if not body or body[-1][0] != 'C_RETURN':
+        return False
+    depth = 0
+    for command, arg1, arg2, line in body:
+        if command == 'C_PUSH':
+            depth = depth + 1
+        elif command == 'C_POP' or command == 'C_IF':
+            depth = depth - 1
+        elif command == 'C_ARITHMETIC' and arg1 not in ['neg', 'not']:
+            depth = depth - 1
+        elif command == 'C_CALL':
+            if depth < arg2:
+                return False
+            depth = depth + 1 - arg2
+        if depth < 0:
+            return False
+        if command in ['C_LABEL', 'C_GOTO', 'C_IF'] and depth != 0:
+            return False
+        if command == 'C_RETURN':
+            if depth != 1:
+                return False
+            depth = 0
+    return True
+
+def _hasLoop(body):
+    '''Returns True if body jumps back to an earlier label. The call of
+    a function with a loop costs little next to the loop, while its
+    inlined body reaches its locals through larger, costlier indexes.'''
+    labels = set()
+    for command, arg1, arg2, line in body:
+        if command == 'C_LABEL':
+            labels.add(arg1)
+        elif command in ['C_GOTO', 'C_IF'] and arg1 in labels:
+            return True
+    return False
+
+def _recursive(function, graph):
+    '''Returns True if function can call itself, directly or not.'''
+    seen = set()
+    pending = list(graph.get(function, ()))
+    while pending:
+        callee = pending.pop()
+        if callee == function:
+            return True
+        if callee not in seen:
+            seen.add(callee)
+            pending.extend(graph.get(callee, ()))
+    return False
+
+def _expandCall(callee, body, numArgs, numLocals, base, site, line):
+    '''Returns the commands that replace a call of callee with numArgs
+    arguments, and the number of locals they add to the caller. The
+    arguments and locals of the callee become the caller's locals from
+    base on, its labels are renamed after the call site and pointer 0
+    and 1 are saved if the callee changes them, as a return would
+    restore them.'''
+    prefix = callee + '$' + str(site) + '$'
+    saved = sorted(set(arg2 for command, arg1, arg2, _ in body
+                       if command == 'C_POP' and arg1 == 'pointer'))
+    scratch = base + numArgs + numLocals
+    code = [('C_POP', 'local', base + i, line) for i in reversed(range(numArgs))]
+    for i in range(numLocals):
+        code.extend([('C_PUSH', 'constant', 0, line), ('C_POP', 'local', base + numArgs + i, line)])
+    for i, index in enumerate(saved):
+        code.extend([('C_PUSH', 'pointer', index, line), ('C_POP', 'local', scratch + i, line)])
+    end = prefix + '$END'
+    for position, (command, arg1, arg2, _) in enumerate(body):
+        if command in ['C_PUSH', 'C_POP'] and arg1 == 'argument':
+            arg1, arg2 = 'local', base + arg2
+        elif command in ['C_PUSH', 'C_POP'] and arg1 == 'local':
+            arg2 = base + numArgs + arg2
+        elif command in ['C_LABEL', 'C_GOTO', 'C_IF']:
+            arg1 = prefix + arg1
+        elif command == 'C_RETURN':
+            if position == len(body) - 1:
+                continue
+            command, arg1, arg2 = 'C_GOTO', end, None
+        code.append((command, arg1, arg2, line))
+    if any(record[0] == 'C_RETURN' for record in body[:-1]):
+        code.append(('C_LABEL', end, None, line))
+    #The return value stays on top of the stack while the pointers
+    #are restored
+    for i, index in enumerate(saved):
+        code.extend([('C_PUSH', 'local', scratch + i, line), ('C_POP', 'pointer', index, line)])
+    return code, numArgs + numLocals + len(saved)
+
+def _bottomUp(functions, graph):
+    '''Returns the names of the functions ordered so that every function
+    comes after the functions it calls, except along recursive calls.'''
+    order = []
+    seen = set()
+    for root in functions:
+        if root in seen:
+            continue
+        seen.add(root)
+        pending = [(root, iter(sorted(graph[root] & functions.keys())))]
+        while pending:
+            function, callees = pending[-1]
+            for callee in callees:
+                if callee not in seen:
+                    seen.add(callee)
+                    pending.append((callee, iter(sorted(graph[callee] & functions.keys()))))
+                    break
+            else:
+                pending.pop()
+                order.append(function)
+    return order
+
+def inlineFunctions(program, size=INLINE_SIZE):
+    '''inlineFunctions(dict, int) -> dict
+
+    Replaces the calls in program to functions of at most size commands
+    (see INLINE_SIZE) by the body of the function, and returns a
+    dictionary mapping the name of each inlined function to the number
+    of calls replaced. Functions with loops are not worth inlining (see
+    _hasLoop()). Functions are inlined into each other from the
+    bottom of the call graph up, so an inlined body has its own calls
+    inlined already. Recursive functions, functions whose stack use
+    differs from the Jack compiler's, and calls from another file to
+    functions that use static variables are left alone. The inlined
+    commands take the line number of the call they replace.
+    '''
+    #Each file as a list of the commands outside of any function and of
+    #the names of the functions it defines, in order
+    layout = {}
+    functions = {}
+    sites = {}
+    for vmfile, commands in program.items():
+        layout[vmfile] = [[]]
+        for record in commands:
+            if record[0] == 'C_FUNCTION':
+                if record[1] in functions:
+                    return {} #A function defined twice cannot be told apart
+                functions[record[1]] = [vmfile, record, []]
+                layout[vmfile].append(record[1])
+            elif len(layout[vmfile]) > 1:
+                functions[layout[vmfile][-1]][2].append(record)
+            else:
+                layout[vmfile][0].append(record)
+            if record[0] == 'C_CALL':
+                sites[record[1]] = sites.get(record[1], 0) + 1
+    graph = callGraph(program)
+    candidates = {}
+    inlined = {}
+    site = 0
+    for function in _bottomUp(functions, graph):
+        vmfile, header, body = functions[function]
+        result = []
+        extra = 0
+        for record in body:
+            command, arg1, arg2, line = record
+            if command != 'C_CALL' or arg1 not in candidates:
+                result.append(record)
+                continue
+            calleeFile, numLocals, calleeBody = candidates[arg1]
+            arguments = [a2 for c, a1, a2, l in calleeBody if a1 == 'argument' and c in ['C_PUSH', 'C_POP']]
+            locals = [a2 for c, a1, a2, l in calleeBody if a1 == 'local' and c in ['C_PUSH', 'C_POP']]
+            statics = any(a1 == 'static' for c, a1, a2, l in calleeBody if c in ['C_PUSH', 'C_POP'])
+            if (max(arguments, default=-1) >= arg2 or max(locals, default=-1) >= numLocals
+                    or (statics and calleeFile != vmfile)):
+                result.append(record)
+                continue
+            code, slots = _expandCall(arg1, calleeBody, arg2, numLocals, header[2], site, line)
+            result.extend(code)
+            extra = max(extra, slots)
+            site = site + 1
+            inlined[arg1] = inlined.get(arg1, 0) + 1
+        #Gives the function room for the frames of the inlined calls
+        header = ('C_FUNCTION', function, header[2] + extra, header[3])
+        functions[function] = [vmfile, header, result]
+        limit = 4 * size if sites.get(function) == 1 else size
+        if (len(result) <= limit and _balanced(result) and not _hasLoop(result)
+                and not _recursive(function, graph)):
+            candidates[function] = (vmfile, header[2], result)
+    for vmfile, parts in layout.items():
+        commands = list(parts[0])
+        for function in parts[1:]:
+            vmfile, header, body = functions[function]
+            commands.append(header)
+            commands.extend(body)
+        program[vmfile] = commands
+    return inlined
+
+#Words of RAM from 16 to 255, shared by static variables and static frames
+STATIC_WORDS = 240
+
+def allocateStaticFrames(program):
+    '''allocateStaticFrames(dict) -> dict
+
+    Picks the functions of program that can never be active twice at
+    once, as they are not recursive, and whose stack use matches the
+    Jack compiler's (see _balanced()), and gives their arguments,
+    locals and return address fixed RAM addresses. Functions with the
+    smallest frames are picked first, until the frames and the static
+    variables fill STATIC_WORDS. Sys.init is left out, as the bootstrap
+    calls it. Returns a dictionary mapping the name of each picked
+    function to the sorted list of pointer entries (0 for THIS, 1 for
+    THAT) it writes, which it saves and restores itself.
+    '''
+    functions = {}
+    numArgs = {}
+    statics = set()
+    for vmfile, commands in program.items():
+        function = None
+        for command, arg1, arg2, line in commands:
+            if command == 'C_FUNCTION':
+                if arg1 in functions:
+                    return {} #A function defined twice cannot be told apart
+                function = arg1
+                functions[function] = (arg2, [])
+                continue
+            if function is not None:
+                functions[function][1].append((command, arg1, arg2, line))
+            if command == 'C_CALL':
+                numArgs[arg1] = max(numArgs.get(arg1, 0), arg2)
+            elif command in ['C_PUSH', 'C_POP'] and arg1 == 'static':
+                statics.add((Path(vmfile).name, arg2))
+    graph = callGraph(program)
+    frames = []
+    for function, (numLocals, body) in functions.items():
+        if function == 'Sys.init' or not _balanced(body) or _recursive(function, graph):
+            continue
+        arguments = [a2 + 1 for c, a1, a2, l in body if a1 == 'argument' and c in ['C_PUSH', 'C_POP']]
+        pointers = sorted(set(a2 for c, a1, a2, l in body if c == 'C_POP' and a1 == 'pointer'))
+        words = max(arguments + [numArgs.get(function, 0)]) + numLocals + 1 + len(pointers)
+        frames.append((words, function, pointers))
+    free = STATIC_WORDS - len(statics)
+    picked = {}
+    for words, function, pointers in sorted(frames):
+        if words <= free:
+            picked[function] = pointers
+            free = free - words
+    return picked
+
+def reportInlinedFunctions(inlined):
+    '''reportInlinedFunctions(dict) -> None
+
+    Prints the functions inlined by inlineFunctions() and the number
+    of calls replaced.
+    '''
+    print('Function inlining:')
+    for function in sorted(inlined):
+        print('\t{}: inlined at {} calls'.format(function, inlined[function]))
+    print('\ttotal: inlined {} functions at {} calls'.format(len(inlined), sum(inlined.values())))
+
+def reportDeadFunctions(removed, settings):
+    '''reportDeadFunctions(dict, dict) -> None
+
+    Prints the functions removed by eliminateDeadFunctions() and the
+    size of their code when translated with the CodeWriter settings.
+    Every instruction takes one 16-bit word, that is 2 bytes, of ROM.
+    '''
+    print('Dead function elimination:')
+    total = 0
+    for function in sorted(removed):
+        asmObject = newWriter(None, settings)
+        asmObject.setFileName(function)
+        for command, arg1, arg2, line in removed[function]:
+            asmObject.writeCommand(command, arg1, arg2)
+        size = sum(1 for instruction in asmObject.instructions if instruction[0] != '(')
+        print('\t{}: removed {} instructions'.format(function, size))
+        total = total + size
+    print('\ttotal: removed {} functions, {} instructions ({} bytes)'.format(
+        len(removed), total, 2 * total))
+
+def translate(vmfile, asmObject, commands=None):
+    '''translate(str, CodeWriter, list) -> None
+
+    Translates the VM file at vmfile, adding its code to asmObject. If
+    commands is given, its records are translated instead of the
+    content of the file.
+    '''
+    asmObject.setFileName(vmfile)
+    if commands is None:
+        commands = Lexer(vmfile).code()
+    if isinstance(commands, CommandArray):
+        asmObject.writeCode(commands)
+        return
+    sourceMap = asmObject.origins is not None
+    for command, arg1, arg2, line in commands:
+        if sourceMap:
+            asmObject.setOrigin(line, command, arg1, arg2)
+        asmObject.writeCommand(command, arg1, arg2)
+
+def translateFragment(vmfile, settings, commands=None):
+    '''translateFragment(str, dict, list) -> tuple
+
+    Translates the VM file at vmfile (or its records in commands, see
+    translate()) on its own, with a CodeWriter created from the keyword
+    arguments in settings, and returns its fragment. Used by the worker
+    processes of a parallel translation.
+    '''
+    asmObject = newWriter(None, settings)
+    translate(vmfile, asmObject, commands)
+    return asmObject.fragment()
+
+def translateFiles(vmFiles, settings, jobs=1, program=None):
+    '''translateFiles(list, dict, int, dict) -> iterator
+
+    Translates each of the VM files with translateFragment() and
+    yields their fragments in the order of vmFiles, so that each can
+    be written out and dropped before the next. The files are
+    translated in a pool of jobs processes if jobs is more than 1. If
+    program is given, the files are translated from its records.
+    '''
+    if program is None:
+        commands = [None] * len(vmFiles)
+    else:
+        #Compact records are much cheaper to send to the workers
+        commands = [compact(program[vmfile]) for vmfile in vmFiles]
+    if jobs > 1 and len(vmFiles) > 1:
+        #Fragments come back in the order of vmFiles, whichever worker
+        #finishes first, so the output matches the serial translation
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            yield from pool.map(translateFragment, vmFiles, repeat(settings), commands)
+        return
+    for vmfile, records in zip(vmFiles, commands):
+        yield translateFragment(vmfile, settings, records)
+
+def getSettings(options):
+    '''getSettings(dict) -> dict
+
+    Returns the CodeWriter settings (see newWriter()) selected by the
+    command line options.
+    '''
+    return {'compare': options.get('compare', 'inline'),
+            'backend': options.get('backend', 'stack'),
+            'sourceMap': 'map' in options}
+
+def translateProgram(asmFname, vmFiles, options):
+    '''translateProgram(str, list, dict) -> None
+
+    Translates the VM files into the ASM file at asmFname, with the
+    command line options given as returned by getOptions(). With
+    --format=hack or --format=bin the machine code is written to a file
+    of that extension next to asmFname instead.
+    '''
+    settings = getSettings(options)
+    outputFormat = options.get('format', 'asm')
+    program = None
+    if any(name in options for name in ['inline', 'prune', 'fold', 'static-frames', 'fuse']):
+        program = loadProgram(vmFiles)
+    if 'inline' in options:
+        size = INLINE_SIZE if options['inline'] is True else int(options['inline'])
+        reportInlinedFunctions(inlineFunctions(program, size))
+    if 'prune' in options:
+        reportDeadFunctions(eliminateDeadFunctions(program), settings)
+    if 'static-frames' in options:
+        settings['staticFrames'] = allocateStaticFrames(program)
+        print('Static frames: {} of {} functions'.format(len(settings['staticFrames']),
+                                                         len(callGraph(program)) - 1))
+    if 'fold' in options:
+        before = sum(len(commands) for commands in program.values())
+        for vmfile in vmFiles:
+            program[vmfile] = foldConstants(program[vmfile])
+        after = sum(len(commands) for commands in program.values())
+        print('Constant folding: removed {} commands'.format(before - after))
+    if 'fuse' in options:
+        for vmfile in vmFiles:
+            program[vmfile] = fuseBranches(program[vmfile])
+    cache = None
+    if 'cache' in options:
+        limit = int(options.get('cache-size', 64)) * 1024 * 1024
+        cache = FragmentCache(asmFname[:-4] + '.cache', limit)
+    #Only the fragments from the cache are held; the others are written
+    #out as they are translated
+    fragments = {}
+    keys = {}
+    if cache is not None:
+        for vmfile in vmFiles:
+            commands = None
+            if program is not None:
+                commands = program[vmfile]
+            keys[vmfile] = cache.key(vmfile, settings, commands)
+            fragment = cache.get(keys[vmfile])
+            if fragment is not None:
+                fragments[vmfile] = fragment
+    #Machine code goes straight to a .hack or .bin file next to the .asm.
+    #The writer only opens it in close(), so that an invalid file leaves
+    #no output behind
+    outputFname = asmFname[:-4] + '.' + outputFormat
+    asmObject = newWriter(outputFname, settings, 'optimize' in options, outputFormat)
+    #Handles Multiple Files and writes all in one asm File
+    changed = [vmfile for vmfile in vmFiles if vmfile not in fragments]
+    jobs = int(options.get('jobs', 1))
+    translated = translateFiles(changed, settings, jobs, program)
+    for vmfile in vmFiles:
+        fragment = fragments.pop(vmfile, None)
+        if fragment is None:
+            fragment = next(translated)
+            if cache is not None:
+                cache.put(keys[vmfile], fragment)
+        asmObject.writeFragment(fragment)
+    asmObject.close()
+    if cache is not None:
+        cache.evict()
+        print('Cache: reused {} of {} files'.format(cache.hits, len(vmFiles)))
+
+class Watcher(object):
+    '''Watches the VM files of a program and rebuilds its output each
+    time one of them changes. The records and fragment of every file
+    are kept in memory, so a rebuild only lexes the files that changed
+    and only translates the files whose commands changed.
+    '''
+
+    def __init__(self, asmFname, source, options):
+        '''Gets ready to watch source, a VM file or a directory of them,
+        and to write the output as translateProgram() would for the
+        command line options.
+        '''
+        self.asmFname = asmFname
+        self.source = Path(source)
+        self.options = options
+        self.settings = getSettings(options)
+        self.format = options.get('format', 'asm')
+        self._stamps = {}
+        self._records = {}
+        self._errors = {}
+        #The records each fragment was translated from, after --inline
+        #and --prune
+        self._translated = {}
+        self._fragments = {}
+
+    def __str__(self):
+        return 'Watcher object.'
+
+    def scan(self):
+        '''W.scan() -> bool
+
+        Lexes the files added or changed since the last scan and forgets
+        the removed ones. Returns True if anything changed.
+        '''
+        vmFiles = listVmFiles(self.source)
+        changed = False
+        for vmfile in list(self._stamps):
+            if vmfile not in vmFiles:
+                for table in [self._stamps, self._records, self._errors,
+                              self._translated, self._fragments]:
+                    table.pop(vmfile, None)
+                changed = True
+        for vmfile in vmFiles:
+            try:
+                stat = os.stat(vmfile)
+            except OSError:
+                continue #Removed since the directory was listed
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if self._stamps.get(vmfile) == stamp:
+                continue
+            self._stamps[vmfile] = stamp
+            changed = True
+            try:
+                self._records[vmfile] = Lexer(vmfile).code()
+                self._errors.pop(vmfile, None)
+            except ValueError as error:
+                self._errors[vmfile] = str(error)
+        return changed
+
+    def build(self):
+        '''W.build() -> int
+
+        Translates the files whose commands changed since the last build
+        and rewrites the output file from all the fragments. The output
+        is written to a temporary file first and then renamed, so it is
+        never seen half written. Returns the number of files translated.
+        '''
+        vmFiles = sorted(self._records)
+        program = {vmfile: self._records[vmfile] for vmfile in vmFiles}
+        if 'inline' in self.options:
+            size = INLINE_SIZE if self.options['inline'] is True else int(self.options['inline'])
+            inlineFunctions(program, size)
+        if 'prune' in self.options:
+            eliminateDeadFunctions(program)
+        if 'static-frames' in self.options:
+            frames = allocateStaticFrames(program)
+            if frames != self.settings.get('staticFrames'):
+                #The code of every file depends on the frames
+                self.settings['staticFrames'] = frames
+                self._translated = {}
+        for vmfile in vmFiles:
+            program[vmfile] = compact(program[vmfile])
+        stale = [vmfile for vmfile in vmFiles if self._translated.get(vmfile) != program[vmfile]]
+        for vmfile in stale:
+            self._translated[vmfile] = program[vmfile]
+            if 'fold' in self.options:
+                program[vmfile] = foldConstants(program[vmfile])
+            if 'fuse' in self.options:
+                program[vmfile] = fuseBranches(program[vmfile])
+        jobs = int(self.options.get('jobs', 1))
+        for vmfile, fragment in zip(stale, translateFiles(stale, self.settings, jobs, program)):
+            self._fragments[vmfile] = fragment
+        outputFname = self.asmFname[:-4] + '.' + self.format
+        temporary = self.asmFname[:-4] + '.tmp' + str(os.getpid()) + '.' + self.format
+        asmObject = newWriter(temporary, self.settings, 'optimize' in self.options, self.format)
+        for vmfile in vmFiles:
+            asmObject.writeFragment(self._fragments[vmfile])
+        asmObject.close()
+        os.replace(temporary, outputFname)
+        if self.settings['sourceMap']:
+            os.replace(str(Path(temporary).with_suffix('.map')), str(Path(outputFname).with_suffix('.map')))
+        return len(stale)
+
+    def run(self, interval):
+        '''W.run(float) -> None
+
+        Checks the files for changes every interval seconds and rebuilds
+        the output when they change, until interrupted.
+        '''
+        print('Watching', self.source, '(press Ctrl-C to stop)')
+        try:
+            while True:
+                if self.scan():
+                    self._report()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    def _report(self):
+        '''W._report() -> None
+
+        Rebuilds the output, or prints the errors that prevent it.
+        '''
+        if self._errors:
+            for message in self._errors.values():
+                print('Error:', message)
+            return
+        start = time.perf_counter()
+        count = self.build()
+        print('Rebuilt {}: translated {} of {} files in {:.3f} s'.format(
+            self.asmFname[:-4] + '.' + self.format, count, len(self._records),
+            time.perf_counter() - start))
+
+def printCostTable(settings):
+    '''printCostTable(dict) -> None
+
+    Prints the cost, in instructions, of every sequence the CodeWriter
+    chosen by settings can write for push and pop, and marks the one it
+    picks.
+    '''
+    asmObject = newWriter(None, settings)
+    asmObject.setFileName('Foo.vm')
+    print('{:<6}{:<10}{:>6}  {}'.format('', 'segment', 'index', 'cost of each sequence (* picked)'))
+    for command, strategies in [('push', asmObject._pushStrategies), ('pop', asmObject._popStrategies)]:
+        for segment in ['constant', 'local', 'argument', 'this', 'that', 'temp', 'pointer', 'static']:
+            if segment == 'constant' and command == 'pop':
+                continue
+            indexes = {'pointer': [0, 1], 'temp': [0, 7], 'static': [0]}.get(segment, [0, 1, 2, 3, 4, 5, 8, 100])
+            for index in indexes:
+                options = strategies(segment, index)
+                picked = cheapest(options)[0]
+                costs = ['{}{}={}'.format('*' if name == picked else '', name, len(code))
+                         for name, code in options]
+                print('{:<6}{:<10}{:>6}  {}'.format(command, segment, index, ' '.join(costs)))
+
 def main():
-    asmFname, vmFiles = getFileNames()
-    # asmFname now contains the name of the file to output to.
-    # vmFiles is a list contianing the names of VM files to be translated.
-    #asmFname returns complete Path to the output file not just the name.
-    asmFname = asmFname.split("\\")[-1]
-    asmObject = CodeWriter(asmFname)
-    for vmfile in vmFiles:
-        #Handles Multiple Files and writes all in one asm File
-        vmObject = Parser(vmfile)
-        asmObject.setFileName(vmfile)
-         
-        while vmObject.hasMoreCommands() == True:
-            while '//' in vmObject.data: #using while loop for more than 1 comments
-                index = vmObject.data.index('//') #Finds the start of comments
-                if index == 0:
-                    vmObject.advance()
-                    #After moving to next line have to perform the remove space operation again
-                else:
-                    #this takes care of comments writen on same line as instructions
-                    vmObject.data = vmObject.data[:index]
-                while vmObject.data == '\n': #using while loop for more than 1 emptyline
-                     vmObject.advance()
-            index = 0
-            if vmObject.commandType() != "C_RETURN":
-                index = vmObject.arg2()
-            if vmObject.commandType() == 'C_ARITHMETIC':
-                asmObject.writeArithmetic(vmObject.data)
-            elif vmObject.commandType() == "C_PUSH" or vmObject.commandType() == "C_POP":
-                command = vmObject.commandType()
-                segment = vmObject.arg1()
-                asmObject.writePushPop(command,segment,index)
-             
-            vmObject.advance()
-    asmObject.close()
+    options = getOptions()
+    #Checked before anything is written, since an unknown value would
+    #only fail once the output is open
+    for name, values in CHOICES.items():
+        if name in options and options[name] not in values:
+            printUsage()
+            print('Invalid {}:'.format(name), options[name], '\nAborting!')
+            sys.exit(1)
+    if 'costs' in options:
+        printCostTable(getSettings(options))
+        return
+    asmFname, vmFiles = getFileNames()
+    # asmFname now contains the name of the file to output to.
+    # vmFiles is a list contianing the names of VM files to be translated.
+    #asmFname returns complete Path to the output file not just the name.
+    asmFname = asmFname.split("\\")[-1]
+    if 'watch' in options:
+        source = [arg for arg in sys.argv[1:] if not arg.startswith('--')][0]
+        interval = 0.5 if options['watch'] is True else float(options['watch'])
+        Watcher(asmFname, source, options).run(interval)
+    else:
+        try:
+            translateProgram(asmFname, vmFiles, options)
+        except ValueError as error:
+            print('Error:', error)
+            sys.exit(1)
 if __name__ == "__main__":
-    # Leave as is.
-    main()
\ No newline at end of file
+    # Leave as is.
+    main()
\ No newline at end of file